@@ -4,7 +4,7 @@ import {
   Code, Heart, Star, Calendar, ChevronDown, ChevronUp, RotateCcw,
   Sparkles, Loader2, Hash, ToggleLeft, ToggleRight,
 } from 'lucide-react';
-import { uploadImage, submitResume, getResumeStatus, JobStatus } from '../services/api';
+import { uploadImage, submitResume, followResumeStatus, JobStatus } from '../services/api';
 import { translations, Language as AppLanguage } from '../translations';
 import { generateJobProfile } from '../services/gemini';
 import logo from '../assets/logo.png';
@@ -680,9 +680,10 @@ const ResumeForm: React.FC<ResumeFormProps> = ({
       }
       const { job_id } = await submitResume(formatSubmissionData(imageUrl));
       setJobStatus('pending');
-      const poll = async () => {
-        try {
-          const status = await getResumeStatus(job_id);
+      // Progress is pushed over SSE (long-poll fallback) instead of polled.
+      followResumeStatus(
+        job_id,
+        (status) => {
           setJobStatus(status.status);
           if (status.status === 'done') {
             setSubmitDone(true);
@@ -693,17 +694,15 @@ const ResumeForm: React.FC<ResumeFormProps> = ({
             setIsSubmitting(false);
             setShowUpsell(false);
             setShowProcessing(false);
-          } else {
-            setTimeout(poll, 3000);
           }
-        } catch (err) {
-          setSubmitError(err instanceof Error ? err.message : 'Lost connection. Please try again.');
+        },
+        (err) => {
+          setSubmitError(err.message);
           setIsSubmitting(false);
           setShowUpsell(false);
           setShowProcessing(false);
-        }
-      };
-      setTimeout(poll, 3000);
+        },
+      );
     } catch (error) {
       setSubmitError(error instanceof Error ? error.message : 'Unknown error');
       setIsSubmitting(false);
@@ -4,13 +4,22 @@ export type JobStatus = 'pending' | 'processing' | 'done' | 'failed';
 
 export interface ResumeJobResponse {
   job_id: string;
+  deduplicated?: boolean;  // an identical submission was already running or done
+}
+
+export interface JobStage {
+  stage: string;    // e.g. "enhance.about", "render.html", "queued.pdf", "render.pdf", "upload"
+  elapsed: number;  // seconds since the worker started the job
 }
 
 export interface ResumeStatusResponse {
   status: JobStatus;
+  stage?: string;     // latest completed pipeline stage
+  stages?: JobStage[];
+  elapsed?: number;
   pdf_url?: string;   // time-limited OSS download URL
   pdf_path?: string;  // legacy field, kept for compatibility
-  drive_url?: string;
+  drive_url?: string;  // may resolve a few seconds after "done" (archived after the job finishes)
   error?: string;
 }
 
@@ -48,7 +57,7 @@ export const submitResume = async (resumeData: any): Promise<ResumeJobResponse>
   return response.json();
 };
 
-// Poll for job progress. Call every 3 s until status is "done" or "failed".
+// One-off job status read. To follow a job to completion use followResumeStatus.
 export const getResumeStatus = async (jobId: string): Promise<ResumeStatusResponse> => {
   const response = await fetch(`${API_BASE_URL}/api/resume-status/${jobId}`, {
     mode: 'cors',
@@ -62,3 +71,88 @@ export const getResumeStatus = async (jobId: string): Promise<ResumeStatusRespon
 
   return response.json();
 };
+
+// Long-poll for the next change: pass the previous response and the request
+// is held (up to ~25 s) until the job's status or stage moves on.
+export const waitForResumeStatus = async (
+  jobId: string,
+  previous?: ResumeStatusResponse,
+): Promise<ResumeStatusResponse> => {
+  const params = new URLSearchParams();
+  if (previous?.status) params.set('status', previous.status);
+  if (previous?.stage) params.set('stage', previous.stage);
+  const response = await fetch(`${API_BASE_URL}/api/resume-status/${jobId}/wait?${params}`, {
+    mode: 'cors',
+    credentials: 'include',
+  });
+
+  if (!response.ok) {
+    const err = await response.json().catch(() => ({}));
+    throw new Error(err.detail || 'Failed to get job status');
+  }
+
+  return response.json();
+};
+
+// Subscribe to job progress over server-sent events instead of polling.
+// onUpdate fires on every stage transition; the stream closes itself once the
+// job is "done" or "failed". If the stream breaks (e.g. a proxy that buffers
+// responses), it is closed and onError is called. Returns a function that
+// stops listening.
+export const watchResumeStatus = (
+  jobId: string,
+  onUpdate: (status: ResumeStatusResponse) => void,
+  onError?: () => void,
+): (() => void) => {
+  const source = new EventSource(`${API_BASE_URL}/api/resume-events/${jobId}`, { withCredentials: true });
+  source.addEventListener('progress', (event) => {
+    const status: ResumeStatusResponse = JSON.parse((event as MessageEvent).data);
+    onUpdate(status);
+    if (status.status === 'done' || status.status === 'failed') source.close();
+  });
+  source.onerror = () => {
+    source.close();
+    onError?.();
+  };
+  return () => source.close();
+};
+
+// Follow a job until it is "done" or "failed": server-sent events where they
+// work, long-polling (waitForResumeStatus) from the last seen state when the
+// stream breaks. onError fires only if long-polling fails too. Returns a
+// function that stops following.
+export const followResumeStatus = (
+  jobId: string,
+  onUpdate: (status: ResumeStatusResponse) => void,
+  onError: (error: Error) => void,
+): (() => void) => {
+  let stopped = false;
+  let last: ResumeStatusResponse | undefined;
+  const isFinal = (status?: ResumeStatusResponse) => status?.status === 'done' || status?.status === 'failed';
+
+  const update = (status: ResumeStatusResponse) => {
+    last = status;
+    onUpdate(status);
+  };
+
+  const longPoll = async () => {
+    while (!stopped && !isFinal(last)) {
+      try {
+        const status = await waitForResumeStatus(jobId, last);
+        if (!stopped) update(status);
+      } catch (err) {
+        if (!stopped) onError(err instanceof Error ? err : new Error('Lost connection. Please try again.'));
+        return;
+      }
+    }
+  };
+
+  const stopWatching = watchResumeStatus(jobId, update, () => {
+    if (!stopped && !isFinal(last)) longPoll();
+  });
+
+  return () => {
+    stopped = true;
+    stopWatching();
+  };
+};
@@ -0,0 +1,185 @@
+"""
+Warm Chromium pool for PDF rendering.
+
+Launching Chromium costs a few seconds and ~350 MB of churn, so a worker
+instance keeps one browser alive across renders and gives every render a fresh,
+isolated BrowserContext instead (no cookies, cache or storage leak between
+resumes). The browser is recycled after PDF_BROWSER_MAX_RENDERS renders, or as
+soon as it is found disconnected (crash / OOM kill).
+
+Playwright objects are bound to the event loop that created them, so the pool
+runs async Playwright on its own daemon thread; callers on other event loops
+(the worker's) await the render without tying up a thread. A render that
+times out is cancelled and gives back its slot.
+
+Config (env):
+    PDF_CONCURRENCY           max renders in flight on one browser (default 2)
+    PDF_BROWSER_MAX_RENDERS   recycle the browser after this many renders (default 100)
+    PDF_RENDER_TIMEOUT        per-render timeout in seconds (default 60)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import os
+import threading
+from typing import Any
+
+PDF_CONCURRENCY = int(os.getenv("PDF_CONCURRENCY", "2"))
+PDF_BROWSER_MAX_RENDERS = int(os.getenv("PDF_BROWSER_MAX_RENDERS", "100"))
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "60"))
+
+_LAUNCH_ARGS = [
+    "--disable-dev-shm-usage",
+    "--no-sandbox",
+    "--no-zygote",
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-default-apps",
+]
+
+_PDF_OPTIONS = {
+    "format": "A4",
+    "print_background": True,
+    "margin": {"top": "0.5mm", "bottom": "0.5mm", "left": "0.5mm", "right": "0.5mm"},
+}
+
+
+class BrowserPool:
+    """One long-lived Chromium, a fresh context per render, bounded concurrency."""
+
+    def __init__(self, concurrency: int = PDF_CONCURRENCY, max_renders: int = PDF_BROWSER_MAX_RENDERS):
+        self._max_renders = max_renders
+        self._start_lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # asyncio primitives bind to the running loop on first use (py3.10+),
+        # which is always the pool thread's loop.
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._browser_lock = asyncio.Lock()
+        self._playwright = None
+        self._browser = None
+        self._renders = 0
+        # Renders in flight per browser, so a retired browser is only closed
+        # once the last render using it has finished.
+        self._in_flight: dict[Any, int] = {}
+
+    # ── Event-loop thread ─────────────────────────────────────────────────────
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="pdf-browser-pool", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+
+    # ── Browser lifecycle (runs on the pool loop) ─────────────────────────────
+
+    async def _acquire_browser(self):
+        async with self._browser_lock:
+            browser = self._browser
+            if browser is not None and (not browser.is_connected() or self._renders >= self._max_renders):
+                reason = "disconnected" if not browser.is_connected() else f"{self._renders} renders"
+                print(f"  [PDF] Recycling Chromium ({reason})")
+                await self._retire(browser)
+                browser = None
+
+            if browser is None:
+                if self._playwright is None:
+                    from playwright.async_api import async_playwright
+                    self._playwright = await async_playwright().start()
+                browser = await self._playwright.chromium.launch(headless=True, args=_LAUNCH_ARGS)
+                self._browser = browser
+                self._renders = 0
+                self._in_flight[browser] = 0
+
+            self._renders += 1
+            self._in_flight[browser] += 1
+            return browser
+
+    async def _release_browser(self, browser) -> None:
+        if browser not in self._in_flight:
+            return  # already closed by _shutdown
+        self._in_flight[browser] -= 1
+        if browser is not self._browser and self._in_flight[browser] == 0:
+            await self._close_browser(browser)
+
+    async def _retire(self, browser) -> None:
+        """Detach the current browser; close it now if idle, else on last release."""
+        if browser is self._browser:
+            self._browser = None
+        if self._in_flight.get(browser, 0) == 0:
+            await self._close_browser(browser)
+
+    async def _close_browser(self, browser) -> None:
+        self._in_flight.pop(browser, None)
+        try:
+            await browser.close()
+        except Exception:  # noqa: BLE001 — a crashed browser may refuse to close
+            pass
+
+    async def _render(self, html: str) -> bytes:
+        """Load an in-memory HTML document and print it to PDF bytes."""
+        async with self._slots:
+            browser = await self._acquire_browser()
+            try:
+                context = await browser.new_context()
+                try:
+                    page = await context.new_page()
+                    # No file round trip: the document is handed to Chromium
+                    # directly. Absolute URLs (signed OSS image, CDN fonts)
+                    # still load; there is no base URL for relative ones.
+                    await page.set_content(html, wait_until="networkidle")
+                    await page.emulate_media(media="print")
+                    return await page.pdf(**_PDF_OPTIONS)
+                finally:
+                    await context.close()
+            except Exception:
+                if not browser.is_connected():
+                    async with self._browser_lock:
+                        await self._retire(browser)
+                raise
+            finally:
+                await self._release_browser(browser)
+
+    async def _shutdown(self) -> None:
+        async with self._browser_lock:
+            for browser in list(self._in_flight):
+                await self._close_browser(browser)
+            self._browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    async def apdf_from_html(self, html: str, timeout: float = PDF_RENDER_TIMEOUT) -> bytes:
+        """Render an in-memory HTML document to A4 PDF bytes without tying up a thread."""
+        return await asyncio.wait_for(asyncio.wrap_future(self._submit(self._render(html))), timeout)
+
+    def close(self) -> None:
+        """Close the browser and stop Playwright. Safe to call more than once."""
+        if self._loop is None:
+            return
+        try:
+            self._submit(self._shutdown()).result(10)
+        except Exception:  # noqa: BLE001 — best-effort at interpreter exit
+            pass
+
+
+_pool: BrowserPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> BrowserPool:
+    """Process-wide pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.close)
+        return _pool
@@ -3,17 +3,28 @@ Resume Enhancement Pipeline
 Processes resume JSON, optimizes wording using LLM, renders to HTML, and converts to PDF.
 """
 
+import asyncio
+import hashlib
 import json
 import os
-import tempfile
+import re
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any
+from typing import Any, Awaitable, Callable, NamedTuple
+from urllib.parse import unquote, urlsplit
 
 from dotenv import load_dotenv
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from jinja2 import Environment, FileSystemLoader, ModuleLoader, Template, select_autoescape
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from gdrive import upload_pdf_to_drive
+from browser_pool import get_pool
+from gdrive import drive_link, reserve_file_id, upload_pdf_to_drive
+import drive_archive
+import images
+import llm_cache
 import oss_storage
 
 load_dotenv(Path(__file__).parent.parent / ".env")
@@ -26,26 +37,90 @@ BASE_DIR = Path(__file__).parent
 TEMPLATES_DIR_EN = BASE_DIR / "templates" / "english"
 TEMPLATES_DIR_BM = BASE_DIR / "templates" / "bahasa_malaysia"
 
-# Ephemeral scratch dir. On Function Compute only /tmp is writable and it is
-# wiped per instance — that is fine, the PDF is uploaded to OSS + Google Drive
-# within the same request before the file is needed again.
-GENERATED_PDF_DIR = Path(tempfile.gettempdir()) / "generated_resume"
-GENERATED_PDF_DIR.mkdir(exist_ok=True)
+# Stage callbacks: called with a stage name such as "enhance.about",
+# "render.html", "render.pdf" or "upload" as the pipeline advances.
+ProgressCallback = Callable[[str], None]
+AsyncProgressCallback = Callable[[str], Awaitable[None]]
 
 
 # ---------------------------
 # LLM Configuration
 # ---------------------------
 
-def get_llm() -> ChatOpenAI:
-    """Initialize and return the LLM instance."""
+# "multi" (default): one call per section + a language pass.
+# "single": one structured-output call for the whole resume, multi as fallback.
+ENHANCE_MODE = os.getenv("ENHANCE_MODE", "multi").lower()
+
+# Max concurrent per-job-entry LLM calls inside enhance_experience.
+EXPERIENCE_CONCURRENCY = int(os.getenv("EXPERIENCE_CONCURRENCY", "5"))
+
+# HTTP connection pool shared by every LLM call in the process. Keep-alive
+# connections amortise the TLS handshake to the model endpoint across calls
+# and across jobs handled by a warm instance.
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))            # per request, seconds
+LLM_KEEPALIVE = float(os.getenv("LLM_KEEPALIVE", "120"))       # idle connection lifetime, seconds
+
+_http_client = None  # sync httpx client, shared by every thread
+# An httpx.AsyncClient is bound to the event loop it first ran on, so each
+# loop (the worker's, a test's asyncio.run, ...) gets its own LLM instance.
+_async_llms: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_sync_llm: ChatOpenAI | None = None
+_llm_lock = threading.Lock()
+
+
+def _http_settings():
+    import httpx
+    limits = httpx.Limits(
+        max_connections=LLM_POOL_SIZE,
+        max_keepalive_connections=LLM_POOL_SIZE,
+        keepalive_expiry=LLM_KEEPALIVE,
+    )
+    return limits, httpx.Timeout(LLM_TIMEOUT, connect=10.0)
+
+
+def _new_llm(http_async_client=None) -> ChatOpenAI:
+    global _http_client
+    if _http_client is None:
+        import httpx
+        limits, timeout = _http_settings()
+        _http_client = httpx.Client(limits=limits, timeout=timeout)
     return ChatOpenAI(
         model="gpt-4o-mini",  # Cheapest GPT-4 class model
         temperature=0,
-        openai_api_key=os.getenv("OPENAI_API_KEY")
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=_http_client,
+        http_async_client=http_async_client,
     )
 
 
+def get_llm() -> ChatOpenAI:
+    """
+    Return the LLM instance for the calling context, creating it on first use.
+
+    Sync calls from any thread share one pooled httpx client: the OpenAI
+    client is thread-safe, and sharing it is what lets connections be reused
+    instead of re-established for each of the five calls per job. Async calls
+    share a pooled client per event loop.
+    """
+    global _sync_llm
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    with _llm_lock:
+        if loop is None:
+            if _sync_llm is None:
+                _sync_llm = _new_llm()
+            return _sync_llm
+        llm = _async_llms.get(loop)
+        if llm is None:
+            import httpx
+            limits, timeout = _http_settings()
+            llm = _async_llms[loop] = _new_llm(httpx.AsyncClient(limits=limits, timeout=timeout))
+        return llm
+
+
 # ---------------------------
 # Template Selection
 # ---------------------------
@@ -79,6 +154,56 @@ def get_templates_dir(language: str) -> Path:
     return TEMPLATES_DIR_EN
 
 
+# ---------------------------
+# Template Environments
+# ---------------------------
+
+# Optional directory of precompiled template modules (see compile_templates).
+# The container image sets this so cold starts skip Jinja parsing entirely;
+# left unset in dev so edits to templates/ are picked up on restart.
+TEMPLATES_COMPILED_DIR = os.getenv("TEMPLATES_COMPILED_DIR", "")
+
+_ENV_OPTIONS = {
+    "autoescape": select_autoescape(["html"]),
+    "auto_reload": False,  # templates never change inside a running instance
+    "cache_size": -1,      # keep every compiled template; there are only 26
+}
+
+
+def _make_environment(templates_dir: Path) -> Environment:
+    """Build one Environment per language, preferring precompiled modules."""
+    compiled_dir = Path(TEMPLATES_COMPILED_DIR) / templates_dir.name if TEMPLATES_COMPILED_DIR else None
+    if compiled_dir and compiled_dir.is_dir():
+        loader = ModuleLoader(str(compiled_dir))
+    else:
+        loader = FileSystemLoader(str(templates_dir))
+    return Environment(loader=loader, **_ENV_OPTIONS)
+
+
+# Built once per process and warmed at import: every template (A–M × both
+# languages) is compiled up front so render_to_html does no file I/O.
+_ENVIRONMENTS = {d: _make_environment(d) for d in (TEMPLATES_DIR_EN, TEMPLATES_DIR_BM)}
+for _env in _ENVIRONMENTS.values():
+    for _template_file in TEMPLATE_MAP.values():
+        _env.get_template(_template_file)
+
+
+def get_template(template_key: str, language: str = "English") -> Template:
+    """Return the cached, compiled template for a template key and language."""
+    return _ENVIRONMENTS[get_templates_dir(language)].get_template(get_template_file(template_key))
+
+
+def compile_templates(target_dir: str | Path) -> None:
+    """
+    Write precompiled template modules for ModuleLoader, one subdirectory per
+    language. Run at image build time, then point TEMPLATES_COMPILED_DIR at
+    target_dir.
+    """
+    for templates_dir in (TEMPLATES_DIR_EN, TEMPLATES_DIR_BM):
+        env = Environment(loader=FileSystemLoader(str(templates_dir)), **_ENV_OPTIONS)
+        env.compile_templates(str(Path(target_dir) / templates_dir.name), zip=None, ignore_errors=False)
+
+
 # ---------------------------
 # JSON Parsing Helper
 # ---------------------------
@@ -105,6 +230,72 @@ def parse_llm_json_response(raw: str) -> Any:
     return json.loads(raw)
 
 
+def _strip_text(raw: str) -> str:
+    """Parser for plain-text answers: drop whitespace and stray quotes."""
+    return raw.strip().strip('"')
+
+
+def invoke_cached(
+    prompt: ChatPromptTemplate,
+    llm: ChatOpenAI,
+    variables: dict,
+    parse=parse_llm_json_response,
+    json_mode: bool = False,
+) -> Any:
+    """
+    Run prompt | llm through the LLM response cache (see llm_cache.py) and
+    return the parsed answer. Only answers that parse are cached, and only
+    deterministic (temperature 0) calls are cached at all.
+
+    json_mode requests OpenAI structured JSON output, which guarantees the
+    reply is a single valid JSON object.
+    """
+    messages, key, cached = _cache_lookup(prompt, llm, variables, json_mode)
+    if cached is not None:
+        return parse(cached)
+
+    content = _runnable(llm, json_mode).invoke(messages).content
+    result = parse(content)
+    if key:
+        llm_cache.get_cache().set(key, content)
+    return result
+
+
+async def ainvoke_cached(
+    prompt: ChatPromptTemplate,
+    llm: ChatOpenAI,
+    variables: dict,
+    parse=parse_llm_json_response,
+    json_mode: bool = False,
+) -> Any:
+    """Async variant of invoke_cached. The cache lookup itself is a blocking
+    OSS read on a miss in memory, so it runs in a worker thread."""
+    messages, key, cached = await asyncio.to_thread(_cache_lookup, prompt, llm, variables, json_mode)
+    if cached is not None:
+        return parse(cached)
+
+    content = (await _runnable(llm, json_mode).ainvoke(messages)).content
+    result = parse(content)
+    if key:
+        await asyncio.to_thread(llm_cache.get_cache().set, key, content)
+    return result
+
+
+def _cache_lookup(prompt: ChatPromptTemplate, llm: ChatOpenAI, variables: dict, json_mode: bool):
+    """Render the prompt and consult the cache. Returns (messages, key | None, cached | None)."""
+    messages = prompt.format_messages(**variables)
+    cache = llm_cache.get_cache() if not llm.temperature else None
+    if not cache:
+        return messages, None, None
+    model = f"{llm.model_name}+json" if json_mode else llm.model_name
+    key = llm_cache.make_key(model, llm.temperature, [(m.type, m.content) for m in messages])
+    return messages, key, cache.get(key)
+
+
+def _runnable(llm: ChatOpenAI, json_mode: bool):
+    return llm.bind(response_format={"type": "json_object"}) if json_mode else llm
+
+
 # ---------------------------
 # Experience Enhancer
 # ---------------------------
@@ -119,18 +310,9 @@ def _determine_targets(n_jobs: int) -> tuple[int, int]:
         return 3, 45
 
 
-def enhance_experience(resume: dict, llm: ChatOpenAI) -> dict:
-    """Enhance job experience bullet points with impactful, measurable language."""
-    n_jobs = resume.get("number of jobs", 0)
-
-    if n_jobs == 0 or not resume.get("experience"):
-        return resume
-
-    target, max_words = _determine_targets(n_jobs)
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a professional resume writer. Return ONLY a JSON array of strings."),
-        ("user", """Company: {company}
+_EXPERIENCE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a professional resume writer. Return ONLY a JSON array of strings."),
+    ("user", """Company: {company}
 Title: {title}
 
 Existing bullets:
@@ -146,24 +328,51 @@ RULES:
 - Each bullet ≤ {max_words} words.
 
 Return ONLY a JSON array of strings. Example: ["Did X", "Improved Y", "Built Z"]""")
-    ])
+])
+
 
-    chain = prompt | llm
+def _experience_requests(resume: dict) -> list[tuple[dict, dict]]:
+    """Return (experience entry, prompt variables) for every entry to rewrite."""
+    n_jobs = resume.get("number of jobs", 0)
+
+    if n_jobs == 0 or not resume.get("experience"):
+        return []
 
+    target, max_words = _determine_targets(n_jobs)
+
+    requests = []
     for exp in resume.get("experience", []):
         existing_md = "\n".join(f"- {b}" for b in exp.get("details", []))
-        try:
-            response = chain.invoke({
-                "company": exp.get("company", ""),
-                "title": exp.get("title", ""),
-                "existing": existing_md or "No existing bullets",
-                "target": target,
-                "max_words": max_words
-            })
-            exp["details"] = parse_llm_json_response(response.content)
-        except Exception as e:
-            print(f"Warning: Failed to enhance experience '{exp.get('title')}': {e}")
-            continue
+        requests.append((exp, {
+            "company": exp.get("company", ""),
+            "title": exp.get("title", ""),
+            "existing": existing_md or "No existing bullets",
+            "target": target,
+            "max_words": max_words
+        }))
+    return requests
+
+
+def enhance_experience(resume: dict, llm: ChatOpenAI) -> dict:
+    """Enhance job experience bullet points with impactful, measurable language."""
+    requests = _experience_requests(resume)
+    if not requests:
+        return resume
+
+    # One call per job entry, dispatched concurrently so a candidate with five
+    # jobs waits for one LLM round trip, not five. Sharing `llm` across these
+    # threads is safe (see get_llm). A failed entry keeps its original
+    # bullets and does not affect the others.
+    with ThreadPoolExecutor(max_workers=min(max(1, EXPERIENCE_CONCURRENCY), len(requests))) as executor:
+        futures = [
+            (exp, executor.submit(invoke_cached, _EXPERIENCE_PROMPT, llm, variables))
+            for exp, variables in requests
+        ]
+        for exp, f in futures:
+            try:
+                exp["details"] = f.result()
+            except Exception as e:
+                print(f"Warning: Failed to enhance experience '{exp.get('title')}': {e}")
 
     return resume
 
@@ -172,16 +381,9 @@ Return ONLY a JSON array of strings. Example: ["Did X", "Improved Y", "Built Z"]
 # Strength Enhancer
 # ---------------------------
 
-def enhance_strength(resume: dict, llm: ChatOpenAI) -> dict:
-    """Generate or enhance professional strengths based on experience level."""
-    n_jobs = resume.get("number of jobs", 0)
-    title = resume.get("title", "Professional")
-    existing_strengths = resume.get("strength", [])
-
-    if n_jobs == 0:
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are a resume builder AI. Return ONLY a JSON array of strings."),
-            ("user", """Candidate has no job experience but wants to apply for: {title}
+_STRENGTH_PROMPT_ENTRY_LEVEL = ChatPromptTemplate.from_messages([
+    ("system", "You are a resume builder AI. Return ONLY a JSON array of strings."),
+    ("user", """Candidate has no job experience but wants to apply for: {title}
 
 Existing strengths (if any):
 {existing}
@@ -193,11 +395,11 @@ Generate exactly 8 professional-strength bullet points (≤20 words each) highli
 - Eagerness to learn
 
 Return ONLY a JSON array of 8 strengths.""")
-        ])
-    else:
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are a resume assistant. Return ONLY a JSON array of strings."),
-            ("user", """Role: {title}
+])
+
+_STRENGTH_PROMPT_EXPERIENCED = ChatPromptTemplate.from_messages([
+    ("system", "You are a resume assistant. Return ONLY a JSON array of strings."),
+    ("user", """Role: {title}
 
 Existing strengths:
 {existing}
@@ -206,14 +408,22 @@ Summarize the candidate's professional strengths in 1 comprehensive item (≤60
 Focus on measurable impacts and key competencies.
 
 Return ONLY a JSON array with one string.""")
-        ])
+])
+
+
+def _strength_request(resume: dict) -> tuple[ChatPromptTemplate, dict]:
+    n_jobs = resume.get("number of jobs", 0)
+    existing_strengths = resume.get("strength", [])
+    prompt = _STRENGTH_PROMPT_ENTRY_LEVEL if n_jobs == 0 else _STRENGTH_PROMPT_EXPERIENCED
+    existing_md = "\n".join(f"- {s}" for s in existing_strengths) if existing_strengths else "None provided"
+    return prompt, {"title": resume.get("title", "Professional"), "existing": existing_md}
 
-    chain = prompt | llm
 
+def enhance_strength(resume: dict, llm: ChatOpenAI) -> dict:
+    """Generate or enhance professional strengths based on experience level."""
+    prompt, variables = _strength_request(resume)
     try:
-        existing_md = "\n".join(f"- {s}" for s in existing_strengths) if existing_strengths else "None provided"
-        response = chain.invoke({"title": title, "existing": existing_md})
-        resume["strength"] = parse_llm_json_response(response.content)
+        resume["strength"] = invoke_cached(prompt, llm, variables)
     except Exception as e:
         print(f"Warning: Failed to enhance strengths: {e}")
 
@@ -224,17 +434,9 @@ Return ONLY a JSON array with one string.""")
 # About Section Enhancer
 # ---------------------------
 
-def enhance_about(resume: dict, llm: ChatOpenAI) -> dict:
-    """Polish the 'about' section to be more professional and impactful."""
-    title = resume.get("title", "Professional")
-    current_about = resume.get("about", "")
-    n_jobs = resume.get("number of jobs", 0)
-
-    experience_level = "entry-level candidate" if n_jobs == 0 else f"professional with {n_jobs} role(s)"
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a professional resume writer. Return ONLY the enhanced text, no quotes or formatting."),
-        ("user", """Role: {title}
+_ABOUT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a professional resume writer. Return ONLY the enhanced text, no quotes or formatting."),
+    ("user", """Role: {title}
 Experience Level: {experience_level}
 
 Current about section:
@@ -247,17 +449,24 @@ Rewrite this into a polished professional summary (2-3 sentences, ≤60 words):
 - Use confident, professional tone
 
 Return ONLY the enhanced text.""")
-    ])
+])
+
+
+def _about_request(resume: dict) -> tuple[ChatPromptTemplate, dict]:
+    n_jobs = resume.get("number of jobs", 0)
+    experience_level = "entry-level candidate" if n_jobs == 0 else f"professional with {n_jobs} role(s)"
+    return _ABOUT_PROMPT, {
+        "title": resume.get("title", "Professional"),
+        "experience_level": experience_level,
+        "current_about": resume.get("about", "") or "No description provided"
+    }
 
-    chain = prompt | llm
 
+def enhance_about(resume: dict, llm: ChatOpenAI) -> dict:
+    """Polish the 'about' section to be more professional and impactful."""
+    prompt, variables = _about_request(resume)
     try:
-        response = chain.invoke({
-            "title": title,
-            "experience_level": experience_level,
-            "current_about": current_about or "No description provided"
-        })
-        resume["about"] = response.content.strip().strip('"')
+        resume["about"] = invoke_cached(prompt, llm, variables, parse=_strip_text)
     except Exception as e:
         print(f"Warning: Failed to enhance about section: {e}")
 
@@ -268,16 +477,9 @@ Return ONLY the enhanced text.""")
 # Achievement Enhancer
 # ---------------------------
 
-def enhance_achievements(resume: dict, llm: ChatOpenAI) -> dict:
-    """Enhance achievement descriptions with stronger action verbs and metrics."""
-    achievements = resume.get("achievement", [])
-
-    if not achievements:
-        return resume
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a professional resume writer. Return ONLY a JSON array of strings."),
-        ("user", """Role: {title}
+_ACHIEVEMENTS_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a professional resume writer. Return ONLY a JSON array of strings."),
+    ("user", """Role: {title}
 
 Current achievements:
 {achievements}
@@ -289,17 +491,28 @@ Enhance each achievement to be more impactful:
 - Maintain the original meaning and facts
 
 Return ONLY a JSON array with the same number of enhanced achievements.""")
-    ])
+])
 
-    chain = prompt | llm
 
+def _achievements_request(resume: dict) -> tuple[ChatPromptTemplate, dict] | None:
+    achievements = resume.get("achievement", [])
+    if not achievements:
+        return None
+    return _ACHIEVEMENTS_PROMPT, {
+        "title": resume.get("title", "Professional"),
+        "achievements": "\n".join(f"- {a}" for a in achievements)
+    }
+
+
+def enhance_achievements(resume: dict, llm: ChatOpenAI) -> dict:
+    """Enhance achievement descriptions with stronger action verbs and metrics."""
+    request = _achievements_request(resume)
+    if request is None:
+        return resume
+
+    prompt, variables = request
     try:
-        achievements_md = "\n".join(f"- {a}" for a in achievements)
-        response = chain.invoke({
-            "title": resume.get("title", "Professional"),
-            "achievements": achievements_md
-        })
-        resume["achievement"] = parse_llm_json_response(response.content)
+        resume["achievement"] = invoke_cached(prompt, llm, variables)
     except Exception as e:
         print(f"Warning: Failed to enhance achievements: {e}")
 
@@ -338,33 +551,136 @@ PERATURAN:
 }
 
 
-def enhance_resume_language(resume: dict, llm: ChatOpenAI, language: str = "English") -> dict:
-    """Apply final polishing & restructuring in selected language."""
-    instructions = LANGUAGE_INSTRUCTIONS.get(language, LANGUAGE_INSTRUCTIONS["English"])
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a resume formatting assistant. Return ONLY valid JSON."),
-        ("user", """{instructions}
+_LANGUAGE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a resume formatting assistant. Return ONLY valid JSON."),
+    ("user", """{instructions}
 
 Resume JSON:
 {resume_json}
 
 Return the enhanced resume as a valid JSON object.""")
-    ])
+])
+
+
+# Fields the whole-resume prompts leave out: nothing in them is rewritten,
+# and they change between otherwise identical submissions (the client's random
+# `id`, a freshly signed `image` URL), which would make every such prompt an
+# LLM cache miss. They are copied back onto the model's output.
+_PASSTHROUGH_FIELDS = ("id", "image")
+
+
+def _prompt_resume(resume: dict) -> dict:
+    return {k: v for k, v in resume.items() if k not in _PASSTHROUGH_FIELDS}
+
+
+def _restore_passthrough(enhanced: Any, resume: dict) -> Any:
+    if not isinstance(enhanced, dict):
+        return enhanced
+    return {**enhanced, **{k: resume[k] for k in _PASSTHROUGH_FIELDS if k in resume}}
 
-    chain = prompt | llm
 
+def _language_variables(resume: dict, language: str) -> dict:
+    return {
+        "instructions": LANGUAGE_INSTRUCTIONS.get(language, LANGUAGE_INSTRUCTIONS["English"]),
+        "resume_json": json.dumps(_prompt_resume(resume), indent=2)
+    }
+
+
+def enhance_resume_language(resume: dict, llm: ChatOpenAI, language: str = "English") -> dict:
+    """Apply final polishing & restructuring in selected language."""
     try:
-        response = chain.invoke({
-            "instructions": instructions,
-            "resume_json": json.dumps(resume, indent=2)
-        })
-        return parse_llm_json_response(response.content)
+        enhanced = invoke_cached(_LANGUAGE_PROMPT, llm, _language_variables(resume, language))
+        return _restore_passthrough(enhanced, resume)
     except Exception as e:
         print(f"Warning: Failed language enhancement: {e}")
         return resume
 
 
+# ---------------------------
+# Single-Shot Enhancement
+# ---------------------------
+
+_SINGLE_SHOT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a professional resume writer and formatting assistant. Return ONLY a valid JSON object."),
+    ("user", """{instructions}
+
+Resume JSON:
+{resume_json}
+
+In the same pass, rewrite these sections:
+{sections}
+
+Return the complete enhanced resume as one JSON object with every original field preserved.""")
+])
+
+
+def _single_shot_request(resume: dict, language: str) -> tuple[ChatPromptTemplate, dict]:
+    """Collect every section's rewrite rules into one prompt."""
+    n_jobs = resume.get("number of jobs", 0)
+    title = resume.get("title", "Professional")
+    target, max_words = _determine_targets(n_jobs)
+
+    sections = []
+    experience_level = "entry-level candidate" if n_jobs == 0 else f"professional with {n_jobs} role(s)"
+    sections.append(
+        f'- "about": a polished professional summary for a {experience_level} applying as {title} '
+        "(2-3 sentences, ≤60 words). Start with experience level/years, highlight key expertise, "
+        "mention career goals or value proposition, confident professional tone."
+    )
+    if n_jobs and resume.get("experience"):
+        sections.append(
+            f'- "experience": for EVERY entry, rewrite "details" into exactly {target} bullet points, '
+            f"each ≤ {max_words} words. If more exist, keep the strongest, then rewrite them. Clear, "
+            "measurable and professional; industry language; highlight impact with metrics; use the "
+            "entry's company and title as context."
+        )
+    if n_jobs == 0:
+        sections.append(
+            '- "strength": exactly 8 professional-strength bullet points (≤20 words each) covering '
+            "relevant soft skills, academic achievements, transferable skills and eagerness to learn."
+        )
+    else:
+        sections.append(
+            '- "strength": a list with ONE comprehensive item (≤60 words) summarising professional '
+            "strengths, focused on measurable impact and key competencies."
+        )
+    if resume.get("achievement"):
+        sections.append(
+            '- "achievement": enhance each entry with strong action verbs, keep specific metrics, '
+            "≤50 words each, same number of entries, same facts."
+        )
+
+    return _SINGLE_SHOT_PROMPT, {
+        "instructions": LANGUAGE_INSTRUCTIONS.get(language, LANGUAGE_INSTRUCTIONS["English"]),
+        "resume_json": json.dumps(_prompt_resume(resume), indent=2, ensure_ascii=False),
+        "sections": "\n".join(sections),
+    }
+
+
+def _merge_single_shot(enhanced: Any, resume: dict) -> dict:
+    """The single-shot answer as the enhanced resume; raises if it is not one."""
+    if not isinstance(enhanced, dict):
+        raise ValueError(f"expected a JSON object, got {type(enhanced).__name__}")
+    return _restore_passthrough(enhanced, resume)
+
+
+def enhance_resume_single_shot(resume: dict, llm: ChatOpenAI, language: str = "English") -> dict:
+    """
+    Enhance every section and apply the language pass in ONE structured-output
+    request, instead of one call per section (+ one per job) plus a second
+    pass that resends the whole resume.
+
+    Raises on any failure so the caller can fall back to the multi-call path.
+    The input resume is not modified.
+    """
+    prompt, variables = _single_shot_request(resume, language)
+    return _merge_single_shot(invoke_cached(prompt, llm, variables, json_mode=True), resume)
+
+
+def _single_shot_failed(e: Exception) -> None:
+    print(f"Warning: single-shot enhancement failed, falling back to multi-call: {e}")
+
+
 # ---------------------------
 # HTML Rendering
 # ---------------------------
@@ -380,17 +696,16 @@ def render_to_html(resume: dict, template_key: str, language: str = "English") -
 
     Returns:
         Rendered HTML string
-    """
-    templates_dir = get_templates_dir(language)
-    template_file = get_template_file(template_key)
 
-    env = Environment(
-        loader=FileSystemLoader(str(templates_dir)),
-        autoescape=select_autoescape(["html"]),
-    )
-    template = env.get_template(template_file)
-
-    return template.render(**resume)
+    The uploaded photo (`image`) is passed to the template as `profile_image`,
+    inlined as a data URI of its print rendition (see images.inline_src) so
+    Chromium does not fetch it over the network. That can mean OSS calls and
+    a resize, so async callers run this in a thread.
+    """
+    context = dict(resume)
+    if "profile_image" not in context:
+        context["profile_image"] = images.inline_src(resume.get("image"))
+    return get_template(template_key, language).render(**context)
 
 
 def save_html(html_content: str, output_path: str | Path) -> Path:
@@ -405,99 +720,128 @@ def save_html(html_content: str, output_path: str | Path) -> Path:
 
 
 # ---------------------------
-# PDF Conversion
+# PDF Cache
 # ---------------------------
 
-def convert_html_to_pdf(html_path: str | Path, pdf_path: str | Path) -> Path:
-    """
-    Convert HTML file to PDF using Playwright directly.
+# Identical HTML prints to an identical PDF, so rendered PDFs are stored in OSS
+# under a hash of their HTML (pdf/<hash>.pdf) and reused: a regeneration or a
+# retry skips Chromium and the OSS upload, checks the object with a HEAD and
+# re-signs the URL.
+PDF_CACHE_ENABLED = os.getenv("PDF_CACHE", "on").lower() not in ("off", "0", "false")
+# Lifetime of pdf/ objects under the bucket's lifecycle rule (DEPLOYMENT_FC.md).
+PDF_CACHE_LIFETIME = int(os.getenv("PDF_CACHE_LIFETIME", str(24 * 3600)))
 
-    Args:
-        html_path: Path to HTML file
-        pdf_path: Path for output PDF
+# Signed OSS URLs (V1 "Signature=" or V4 "x-oss-signature=" query) embedded in
+# the HTML, e.g. the profile photo.
+_SIGNED_URL_RE = re.compile(r"""(https?://[^\s"'<>?]+)\?[^\s"'<>]*?(?:Signature|x-oss-signature)=[^\s"'<>]*""")
 
-    Returns:
-        Path to generated PDF
+
+def pdf_cache_digest(html_content: str) -> str:
+    """
+    Hash of what Chromium will print. A signed URL differs on every render
+    (expiry and signature) while the object behind it may not, so each one is
+    replaced by its object key and ETag first: the digest follows the image
+    bytes, not the URL.
     """
-    from playwright.sync_api import sync_playwright
+    def _stable(match: re.Match) -> str:
+        key = unquote(urlsplit(match.group(1)).path.lstrip("/"))
+        return f"oss://{key}#{oss_storage.object_etag(key) or ''}"
 
-    html_path = Path(html_path)
-    pdf_path = Path(pdf_path)
-    pdf_path.parent.mkdir(parents=True, exist_ok=True)
+    normalized = _SIGNED_URL_RE.sub(_stable, html_content)
+    return hashlib.sha256(normalized.encode()).hexdigest()
 
+
+def cached_pdf_key(html_content: str) -> str | None:
+    """OSS key the PDF for this HTML is cached under, or None when the cache is off."""
+    if not (PDF_CACHE_ENABLED and oss_storage.is_configured()):
+        return None
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(
-                headless=True,
-                args=[
-                    "--disable-dev-shm-usage",
-                    "--no-sandbox",
-                    "--no-zygote",
-                    "--disable-gpu",
-                    "--disable-extensions",
-                    "--disable-default-apps",
-                ],
-            )
-            try:
-                context = browser.new_context()
-                page = context.new_page()
-
-                file_uri = html_path.as_uri()
-                page.goto(file_uri)
-                page.wait_for_load_state('networkidle')
-                page.emulate_media(media="print")
-
-                page.pdf(
-                    path=str(pdf_path),
-                    format="A4",
-                    print_background=True,
-                    margin={"top": "0.5mm", "bottom": "0.5mm", "left": "0.5mm", "right": "0.5mm"},
-                )
-            finally:
-                context.close()
-                browser.close()
-
-        print(f"  PDF saved to: {pdf_path}")
+        return oss_storage.pdf_cache_key(pdf_cache_digest(html_content))
     except Exception as e:
-        print(f"PDF conversion error: {e}")
-        raise RuntimeError(f"PDF conversion failed: {e}")
+        print(f"  [PDF] Cache key failed, rendering uncached: {e}")
+        return None
 
-    return pdf_path
+
+def cached_pdf_available(key: str | None) -> bool:
+    """
+    True when the PDF for `key` is cached, checked with a HEAD (the bytes are
+    never downloaded; a hit is just re-signed). pdf/ objects are expired by an
+    OSS lifecycle rule, so a hit that would expire before a fresh signed URL
+    does is touched to restart its lifetime.
+    """
+    if key is None:
+        return False
+    try:
+        modified = oss_storage.object_last_modified(key)
+        if modified is None:
+            return False
+        if time.time() - modified + oss_storage.SIGNED_URL_TTL > PDF_CACHE_LIFETIME:
+            oss_storage.touch(key, "application/pdf")
+    except Exception as e:
+        print(f"  [PDF] Cache check failed: {e}")
+        return False
+    print(f"  [PDF] Cache hit: {key}")
+    return True
 
 
 # ---------------------------
 # Pipeline Orchestration
 # ---------------------------
 
-def enhance_resume(resume: dict, language: str = "English") -> dict:
+def enhance_resume(resume: dict, language: str = "English", on_progress: ProgressCallback | None = None) -> dict:
     """
     Enhance all resume sections using LLM.
+
+    ENHANCE_MODE=single makes one structured-output call for everything
+    (see enhance_resume_single_shot) and falls back to the multi-call path if
+    that call fails. The default multi-call path is enhance_resume_multi.
+
+    on_progress, if given, is called with a stage name ("enhance.about", ...)
+    as each section finishes.
+    """
+    if ENHANCE_MODE == "single":
+        try:
+            enhanced = enhance_resume_single_shot(resume, get_llm(), language)
+            if on_progress:
+                on_progress("enhance.single_shot")
+            return enhanced
+        except Exception as e:
+            _single_shot_failed(e)
+    return enhance_resume_multi(resume, language, on_progress)
+
+
+def enhance_resume_multi(resume: dict, language: str = "English", on_progress: ProgressCallback | None = None) -> dict:
+    """
+    Enhance each section with its own LLM call.
     The four independent sections run in parallel threads; the language
     polishing pass runs last because it depends on all four outputs.
     """
-    from concurrent.futures import ThreadPoolExecutor
-
-    # Each thread needs its own ChatOpenAI instance — the underlying
-    # openai sync client is not safe to share across threads.
-    def _about():       enhance_about(resume, get_llm())
-    def _experience():  enhance_experience(resume, get_llm())
-    def _strength():    enhance_strength(resume, get_llm())
-    def _achievements():enhance_achievements(resume, get_llm())
+    # All threads share the pooled LLM client (see get_llm).
+    llm = get_llm()
+    def _about():       enhance_about(resume, llm)
+    def _experience():  enhance_experience(resume, llm)
+    def _strength():    enhance_strength(resume, llm)
+    def _achievements():enhance_achievements(resume, llm)
 
     with ThreadPoolExecutor(max_workers=4) as executor:
-        named_futures = [
-            ("about",        executor.submit(_about)),
-            ("experience",   executor.submit(_experience)),
-            ("strength",     executor.submit(_strength)),
-            ("achievements", executor.submit(_achievements)),
-        ]
-        for name, f in named_futures:
+        names = {
+            executor.submit(_about):        "about",
+            executor.submit(_experience):   "experience",
+            executor.submit(_strength):     "strength",
+            executor.submit(_achievements): "achievements",
+        }
+        for f in as_completed(names):
             try:
                 f.result()
             except Exception as e:
-                print(f"Warning: {name} enhancement failed (continuing): {e}")
+                print(f"Warning: {names[f]} enhancement failed (continuing): {e}")
+            if on_progress:
+                on_progress(f"enhance.{names[f]}")
 
-    return enhance_resume_language(resume, get_llm(), language)
+    enhanced = enhance_resume_language(resume, llm, language)
+    if on_progress:
+        on_progress("enhance.language")
+    return enhanced
 
 
 def process_resume_json(json_input: str | dict, language: str = "English", output_file: str | None = None) -> dict:
@@ -530,77 +874,339 @@ def process_resume_json(json_input: str | dict, language: str = "English", outpu
     return enhanced
 
 
-def pipeline_phase1_llm(
+def resume_file_id(resume_data: dict) -> str:
+    """Stable file name stem for a resume: the phone number, else the name."""
+    phone = resume_data.get("telephone", "").replace(" ", "").replace("-", "").replace("+", "")
+    return phone if phone else resume_data.get("name", "resume").replace(" ", "_")
+
+
+def pipeline_rerender(
+    enhanced_resume: dict,
+    template_key: str = "A",
+    language: str = "English",
+) -> tuple[str, str]:
+    """
+    Phase 1 replacement for re-renders: the resume was already enhanced by an
+    earlier job, so only the HTML render runs — no LLM calls.
+
+    Returns:
+        (html_content, file_id)
+    """
+    print("Phase 1/2: Re-rendering stored resume to HTML (LLM skipped)...")
+    return render_to_html(enhanced_resume, template_key, language), resume_file_id(enhanced_resume)
+
+
+# ---------------------------
+# Uploads
+# ---------------------------
+# OSS is what the user waits on (the download link); the Drive copy is an
+# archive. The two run side by side, and with defer_drive the Drive upload is
+# not done here at all: a Drive file id is reserved so the link can go into
+# the result straight away, and the caller runs archive_pdf once the job has
+# been reported done, which hands the upload to the drive_archive queue.
+
+# "deferred" (default): a job is done after the OSS upload and its Drive copy
+# is queued for drive_archive. "inline": the job waits for both uploads.
+DRIVE_ARCHIVE = os.getenv("DRIVE_ARCHIVE", "deferred").lower()
+
+_upload_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="upload")
+
+
+class PendingArchive(NamedTuple):
+    """A Drive upload left for after the job is done (see upload_pdf)."""
+    drive_file_id: str
+    name: str
+    pdf_bytes: bytes | None  # None after a cache hit; then read from oss_key
+    oss_key: str | None
+
+
+def _store_pdf(pdf_bytes: bytes | None, file_id: str, pdf_name: str, cache_key: str | None, cached: bool) -> tuple[str | None, str | None]:
+    """Upload to OSS; returns (key, time-limited download URL), or Nones on failure."""
+    try:
+        if cache_key is None:
+            key = oss_storage.put_pdf(file_id, pdf_bytes)
+            print(f"  [OSS] PDF uploaded: {key}")
+        elif not cached:
+            key = cache_key
+            oss_storage.put_bytes(key, pdf_bytes, "application/pdf")
+            print(f"  [OSS] PDF uploaded: {key}")
+        else:
+            key = cache_key
+        return key, oss_storage.signed_url(key, filename=pdf_name)
+    except Exception as e:
+        print(f"  [OSS] PDF upload failed: {e}")
+        return None, None
+
+
+def _drive_upload(
+    pdf_bytes: bytes | None, pdf_name: str, drive_file_id: str | None = None, oss_key: str | None = None
+) -> str | None:
+    """Upload to Drive; without pdf_bytes (a PDF cache hit) they are read back from oss_key."""
+    try:
+        if pdf_bytes is None:
+            pdf_bytes = oss_storage.get_bytes(oss_key) if oss_key else None
+            if pdf_bytes is None:
+                raise FileNotFoundError(f"{oss_key} is not in OSS")
+        drive_url = upload_pdf_to_drive(pdf_bytes, pdf_name, drive_file_id)
+        if drive_url:
+            print(f"  [GDrive] Uploaded: {drive_url}")
+        else:
+            print("  [GDrive] Upload skipped — not authorized or upload returned no URL.")
+        return drive_url
+    except Exception as e:
+        print(f"  [GDrive] Upload failed: {e}")
+        return None
+
+
+def _reserve_drive_id() -> str | None:
+    try:
+        return reserve_file_id()
+    except Exception as e:
+        print(f"  [GDrive] Could not reserve a file id: {e}")
+        return None
+
+
+def upload_pdf(
+    pdf_bytes: bytes | None,
+    file_id: str,
+    cache_key: str | None = None,
+    cached: bool = False,
+    defer_drive: bool = False,
+) -> dict:
+    """
+    Upload a rendered PDF to OSS and Google Drive; returns the phase 2 result dict.
+
+    With a cache_key the PDF is stored under that content-addressed key (and
+    not re-uploaded when `cached` says it came from there); the signed URL
+    still downloads as <file_id>_resume.pdf. On a cache hit pdf_bytes may be
+    None: they are only fetched from OSS if an inline Drive upload needs them.
+
+    The OSS and Drive uploads run concurrently. With defer_drive the Drive
+    upload is only planned: the result's drive_url points at a reserved file
+    id and result["drive_pending"] holds the PendingArchive to pass to
+    archive_pdf. The caller must pop it before storing the result.
+    """
+    pdf_name = f"{file_id}_resume.pdf"
+
+    print("Phase 2/2: Uploading PDF...")
+    if defer_drive:
+        drive_future = _upload_executor.submit(_reserve_drive_id)
+    else:
+        drive_future = _upload_executor.submit(_drive_upload, pdf_bytes, pdf_name, None, cache_key)
+
+    key = pdf_url = None
+    if oss_storage.is_configured():
+        key, pdf_url = _store_pdf(pdf_bytes, file_id, pdf_name, cache_key, cached)
+
+    # pdf_path is the file name only — kept in the result for backward compat.
+    result = {"pdf_path": pdf_name, "pdf_url": pdf_url}
+    if defer_drive:
+        drive_file_id = drive_future.result()
+        result["drive_url"] = drive_link(drive_file_id) if drive_file_id else None
+        if drive_file_id:
+            result["drive_pending"] = PendingArchive(drive_file_id, pdf_name, pdf_bytes, key)
+    else:
+        result["drive_url"] = drive_future.result()
+    return result
+
+
+def archive_pdf(pending: PendingArchive) -> str | None:
+    """
+    Finish a deferred Drive upload. With the PDF in OSS it is queued for the
+    archive drainer (one small OSS write); otherwise, in local dev, it is
+    uploaded now. Safe to repeat: the reserved id makes it idempotent.
+    """
+    if drive_archive.is_enabled() and pending.oss_key:
+        drive_archive.enqueue(pending.drive_file_id, pending.name, "application/pdf", pending.oss_key)
+        return drive_link(pending.drive_file_id)
+    return _drive_upload(pending.pdf_bytes, pending.name, pending.drive_file_id, pending.oss_key)
+
+
+# ---------------------------
+# Async Pipeline
+# ---------------------------
+# The same stages built on ainvoke + asyncio.gather, so one worker process
+# multiplexes many jobs' LLM waits on its event loop instead of holding a
+# thread per in-flight call. Prompts and variables are shared with the sync
+# enhancers above. Used by worker.arun_resume_job.
+
+async def aenhance_experience(resume: dict, llm: ChatOpenAI) -> dict:
+    """Async enhance_experience: every entry in flight at once, bounded by EXPERIENCE_CONCURRENCY."""
+    requests = _experience_requests(resume)
+    if not requests:
+        return resume
+
+    limit = asyncio.Semaphore(max(1, EXPERIENCE_CONCURRENCY))
+
+    async def _enhance_entry(variables: dict) -> list:
+        async with limit:
+            return await ainvoke_cached(_EXPERIENCE_PROMPT, llm, variables)
+
+    results = await asyncio.gather(*(_enhance_entry(v) for _, v in requests), return_exceptions=True)
+    for (exp, _), result in zip(requests, results):
+        if isinstance(result, Exception):
+            print(f"Warning: Failed to enhance experience '{exp.get('title')}': {result}")
+        else:
+            exp["details"] = result
+
+    return resume
+
+
+async def aenhance_strength(resume: dict, llm: ChatOpenAI) -> dict:
+    """Async enhance_strength."""
+    prompt, variables = _strength_request(resume)
+    try:
+        resume["strength"] = await ainvoke_cached(prompt, llm, variables)
+    except Exception as e:
+        print(f"Warning: Failed to enhance strengths: {e}")
+
+    return resume
+
+
+async def aenhance_about(resume: dict, llm: ChatOpenAI) -> dict:
+    """Async enhance_about."""
+    prompt, variables = _about_request(resume)
+    try:
+        resume["about"] = await ainvoke_cached(prompt, llm, variables, parse=_strip_text)
+    except Exception as e:
+        print(f"Warning: Failed to enhance about section: {e}")
+
+    return resume
+
+
+async def aenhance_achievements(resume: dict, llm: ChatOpenAI) -> dict:
+    """Async enhance_achievements."""
+    request = _achievements_request(resume)
+    if request is None:
+        return resume
+
+    prompt, variables = request
+    try:
+        resume["achievement"] = await ainvoke_cached(prompt, llm, variables)
+    except Exception as e:
+        print(f"Warning: Failed to enhance achievements: {e}")
+
+    return resume
+
+
+async def aenhance_resume_language(resume: dict, llm: ChatOpenAI, language: str = "English") -> dict:
+    """Async enhance_resume_language."""
+    try:
+        enhanced = await ainvoke_cached(_LANGUAGE_PROMPT, llm, _language_variables(resume, language))
+        return _restore_passthrough(enhanced, resume)
+    except Exception as e:
+        print(f"Warning: Failed language enhancement: {e}")
+        return resume
+
+
+async def aenhance_resume_single_shot(resume: dict, llm: ChatOpenAI, language: str = "English") -> dict:
+    """Async enhance_resume_single_shot."""
+    prompt, variables = _single_shot_request(resume, language)
+    return _merge_single_shot(await ainvoke_cached(prompt, llm, variables, json_mode=True), resume)
+
+
+async def aenhance_resume(
+    resume: dict,
+    language: str = "English",
+    on_progress: AsyncProgressCallback | None = None,
+) -> dict:
+    """Async enhance_resume — same ENHANCE_MODE handling, fallbacks and stage names."""
+    llm = get_llm()
+
+    if ENHANCE_MODE == "single":
+        try:
+            enhanced = await aenhance_resume_single_shot(resume, llm, language)
+            if on_progress:
+                await on_progress("enhance.single_shot")
+            return enhanced
+        except Exception as e:
+            _single_shot_failed(e)
+
+    async def _section(name: str, enhancer) -> None:
+        try:
+            await enhancer(resume, llm)
+        except Exception as e:
+            print(f"Warning: {name} enhancement failed (continuing): {e}")
+        if on_progress:
+            await on_progress(f"enhance.{name}")
+
+    await asyncio.gather(
+        _section("about", aenhance_about),
+        _section("experience", aenhance_experience),
+        _section("strength", aenhance_strength),
+        _section("achievements", aenhance_achievements),
+    )
+
+    enhanced = await aenhance_resume_language(resume, llm, language)
+    if on_progress:
+        await on_progress("enhance.language")
+    return enhanced
+
+
+async def apipeline_phase1_llm(
     resume_data: dict,
     template_key: str = "A",
     language: str = "English",
+    on_progress: AsyncProgressCallback | None = None,
 ) -> tuple[dict, str, str]:
     """
-    Phase 1 (no semaphore needed): LLM enhancement + HTML render.
-    Safe to run for all users simultaneously — uses only network I/O, no Chromium.
+    Phase 1: LLM enhancement + HTML render. Only network I/O and a template
+    render, no Chromium.
 
     Returns:
         (enhanced_resume, html_content, file_id)
     """
-    phone = resume_data.get("telephone", "").replace(" ", "").replace("-", "").replace("+", "")
-    file_id = phone if phone else resume_data.get("name", "resume").replace(" ", "_")
+    file_id = resume_file_id(resume_data)
 
     print("Phase 1/2: Enhancing resume with LLM...")
-    enhanced_resume = enhance_resume(resume_data.copy(), language)
+    enhanced_resume = await aenhance_resume(resume_data.copy(), language, on_progress)
 
+    # The photo rendition may need OSS round trips and a PIL resize (see
+    # images.inline_src), so the render runs off the event loop.
     print("Phase 1/2: Rendering to HTML...")
-    html_content = render_to_html(enhanced_resume, template_key, language)
+    html_content = await asyncio.to_thread(render_to_html, enhanced_resume, template_key, language)
+    if on_progress:
+        await on_progress("render.html")
 
     return enhanced_resume, html_content, file_id
 
 
-def pipeline_phase2_pdf(
+async def apipeline_phase2_pdf(
     html_content: str,
     file_id: str,
+    on_progress: AsyncProgressCallback | None = None,
+    defer_drive: bool = False,
 ) -> dict:
     """
-    Phase 2 (semaphore-guarded): Playwright PDF generation + uploads.
-    Chromium uses ~350 MB per instance — this is the only part that needs the semaphore.
+    Phase 2: PDF generation + uploads.
+    Renders through the process-wide warm Chromium pool, which caps concurrent
+    renders at PDF_CONCURRENCY and reuses one browser across jobs.
 
-    The PDF is written to ephemeral /tmp, then uploaded to OSS (delivery via a
-    signed URL) and Google Drive. Nothing is kept on local disk.
+    The HTML is handed to Chromium in memory and the PDF comes back as bytes,
+    which are uploaded straight to OSS (delivery via a signed URL) and Google
+    Drive. Nothing touches local disk. If the same HTML was rendered before,
+    the cached PDF is reused and Chromium is skipped (see PDF Cache). OSS and
+    Drive calls run in threads; defer_drive is passed to upload_pdf.
 
     Returns:
         {"pdf_path": str, "pdf_url": str | None, "drive_url": str | None}
     """
-    pdf_file_path = GENERATED_PDF_DIR / f"{file_id}_resume.pdf"
-
-    print("Phase 2/2: Converting to PDF...")
-    with tempfile.NamedTemporaryFile(suffix=".html", delete=False, mode="w", encoding="utf-8") as tmp:
-        tmp.write(html_content)
-        tmp_html_path = Path(tmp.name)
-
-    try:
-        convert_html_to_pdf(tmp_html_path, pdf_file_path)
-
-        # Upload to OSS and produce a time-limited download URL for the browser.
-        pdf_url = None
-        if oss_storage.is_configured():
-            try:
-                key = oss_storage.put_pdf(file_id, pdf_file_path)
-                pdf_url = oss_storage.signed_url(key)
-                print(f"  [OSS] PDF uploaded: {key}")
-            except Exception as e:
-                print(f"  [OSS] PDF upload failed: {e}")
-
-        print("Phase 2/2: Uploading PDF to Google Drive...")
-        drive_url = None
+    cache_key = await asyncio.to_thread(cached_pdf_key, html_content)
+    cached = await asyncio.to_thread(cached_pdf_available, cache_key)
+    pdf_bytes = None
+    if not cached:
+        print("Phase 2/2: Converting to PDF...")
         try:
-            drive_url = upload_pdf_to_drive(pdf_file_path)
-            if drive_url:
-                print(f"  Uploaded: {drive_url}")
-            else:
-                print("  [GDrive] Upload skipped — not authorized or upload returned no URL.")
+            pdf_bytes = await get_pool().apdf_from_html(html_content)
+            print(f"  PDF rendered: {len(pdf_bytes)} bytes")
         except Exception as e:
-            print(f"  [GDrive] Upload failed: {e}")
-    finally:
-        tmp_html_path.unlink(missing_ok=True)
-        # Free ephemeral disk immediately once uploads are done.
-        pdf_file_path.unlink(missing_ok=True)
-
-    return {"pdf_path": str(pdf_file_path), "pdf_url": pdf_url, "drive_url": drive_url}
+            print(f"PDF conversion error: {e}")
+            raise RuntimeError(f"PDF conversion failed: {e}")
+    if on_progress:
+        await on_progress("render.pdf")
+
+    # OSS and Drive SDKs are blocking.
+    result = await asyncio.to_thread(upload_pdf, pdf_bytes, file_id, cache_key, cached, defer_drive)
+    if on_progress:
+        await on_progress("upload")
+    return result
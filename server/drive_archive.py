@@ -0,0 +1,197 @@
+"""
+Deferred Google Drive archival queue.
+
+Drive copies of PDFs and profile photos are an archive nobody waits on, so
+they are not uploaded by the job or request that produced them. Instead the
+file's Drive id is reserved up front (gdrive.reserve_file_id, so its link can
+be handed out immediately) and an entry is queued in OSS under drive-queue/:
+
+  drive-queue/<drive_file_id>.json
+    {"drive_file_id": ..., "name": ..., "mimetype": ..., "oss_key": ...,
+     "attempts": 0, "not_before": 0, "enqueued_at": ...}
+
+The reserved Drive id is the idempotency key: it names the queue entry (so
+queueing the same file twice is a no-op) and the Drive file (so re-uploading
+after a crash or an overlapping drain is a 409, treated as done).
+
+drain() works through the queue in rounds of DRIVE_ARCHIVE_BATCH due entries,
+each continuing the listing where the last one stopped. The files are uploaded
+in parallel from their OSS copies, then every public link is granted in one
+Drive batch request — about 1 + 1/N API round trips per file instead of 2. A failed entry is retried with exponential backoff;
+after DRIVE_ARCHIVE_MAX_ATTEMPTS it is moved to drive-queue-dead/ for a look.
+
+On Function Compute, drain runs from a timer trigger on the worker function
+(see main /invoke); elsewhere main starts run_periodically in-process. Without
+OSS there is no queue and callers upload directly.
+
+Config (env):
+    DRIVE_ARCHIVE_BATCH          entries per drain round (default 50)
+    DRIVE_ARCHIVE_CONCURRENCY    parallel uploads within a round (default 4)
+    DRIVE_ARCHIVE_MAX_ATTEMPTS   tries before an entry is dead-lettered (default 8)
+    DRIVE_ARCHIVE_BACKOFF        first retry delay in seconds, doubled per
+                                 attempt up to an hour (default 30)
+    DRIVE_ARCHIVE_DRAIN_SECONDS  time budget of one drain (default 240)
+    DRIVE_ARCHIVE_INTERVAL       seconds between in-process drains (default 60)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import gdrive
+import oss_storage
+
+DRIVE_ARCHIVE_BATCH = int(os.getenv("DRIVE_ARCHIVE_BATCH", "50"))
+DRIVE_ARCHIVE_CONCURRENCY = int(os.getenv("DRIVE_ARCHIVE_CONCURRENCY", "4"))
+DRIVE_ARCHIVE_MAX_ATTEMPTS = int(os.getenv("DRIVE_ARCHIVE_MAX_ATTEMPTS", "8"))
+DRIVE_ARCHIVE_BACKOFF = float(os.getenv("DRIVE_ARCHIVE_BACKOFF", "30"))
+DRIVE_ARCHIVE_DRAIN_SECONDS = float(os.getenv("DRIVE_ARCHIVE_DRAIN_SECONDS", "240"))
+DRIVE_ARCHIVE_INTERVAL = float(os.getenv("DRIVE_ARCHIVE_INTERVAL", "60"))
+
+_MAX_BACKOFF = 3600.0
+# Entries listed per round; some may still be backing off.
+_SCAN_FACTOR = 4
+
+
+def is_enabled() -> bool:
+    """The queue lives in OSS; without it callers upload to Drive directly."""
+    return oss_storage.is_configured()
+
+
+def enqueue(drive_file_id: str, name: str, mimetype: str, oss_key: str) -> None:
+    """Queue the object at oss_key for upload to Drive under a reserved id."""
+    entry = {
+        "drive_file_id": drive_file_id,
+        "name": name,
+        "mimetype": mimetype,
+        "oss_key": oss_key,
+        "attempts": 0,
+        "not_before": 0,
+        "enqueued_at": time.time(),
+    }
+    oss_storage.put_bytes_if_absent(
+        oss_storage.drive_queue_key(drive_file_id), json.dumps(entry).encode(), "application/json"
+    )
+
+
+# ── Drain ─────────────────────────────────────────────────────────────────────
+
+def _due_entries(now: float, marker: str, deadline: float) -> tuple[list[dict[str, Any]], str | None]:
+    """
+    Up to DRIVE_ARCHIVE_BATCH due entries listed after `marker`, paging past
+    any still backing off. Returns them with the marker to continue from, or
+    None once the end of the queue has been scanned.
+    """
+    page = DRIVE_ARCHIVE_BATCH * _SCAN_FACTOR
+    entries = []
+    while True:
+        keys = oss_storage.list_drive_queue(page, marker)
+        for key in keys:
+            marker = key
+            raw = oss_storage.get_bytes(key)
+            if raw is None:
+                continue  # taken by an overlapping drain
+            entry = json.loads(raw)
+            if entry.get("not_before", 0) <= now:
+                entries.append(entry)
+                if len(entries) >= DRIVE_ARCHIVE_BATCH:
+                    return entries, marker
+        if len(keys) < page:
+            return entries, None
+        if time.monotonic() >= deadline:
+            return entries, marker
+
+
+def _upload(entry: dict[str, Any]) -> None:
+    data = oss_storage.get_bytes(entry["oss_key"])
+    if data is None:
+        raise FileNotFoundError(f"{entry['oss_key']} is no longer in OSS")
+    if gdrive.create_file(data, entry["name"], entry["mimetype"], entry["drive_file_id"]) is None:
+        raise RuntimeError("Google Drive is not authorized")
+
+
+def _retry_later(entry: dict[str, Any], error: Exception) -> str:
+    """Reschedule a failed entry, or dead-letter it; returns which."""
+    drive_file_id = entry["drive_file_id"]
+    entry["attempts"] = entry.get("attempts", 0) + 1
+    entry["error"] = str(error)[:500]
+    if entry["attempts"] >= DRIVE_ARCHIVE_MAX_ATTEMPTS or isinstance(error, FileNotFoundError):
+        oss_storage.put_bytes(oss_storage.drive_dead_key(drive_file_id), json.dumps(entry).encode(), "application/json")
+        oss_storage.delete(oss_storage.drive_queue_key(drive_file_id))
+        print(f"[GDrive] Giving up on {entry['name']} after {entry['attempts']} attempts: {error}")
+        return "dead"
+    delay = min(DRIVE_ARCHIVE_BACKOFF * 2 ** (entry["attempts"] - 1), _MAX_BACKOFF)
+    entry["not_before"] = time.time() + delay * random.uniform(0.8, 1.2)
+    oss_storage.put_bytes(oss_storage.drive_queue_key(drive_file_id), json.dumps(entry).encode(), "application/json")
+    return "retried"
+
+
+def _drain_round(entries: list[dict[str, Any]], pool: ThreadPoolExecutor, counts: dict[str, int]) -> None:
+    failures: dict[str, Exception] = {}
+    futures = {entry["drive_file_id"]: pool.submit(_upload, entry) for entry in entries}
+    for drive_file_id, future in futures.items():
+        try:
+            future.result()
+        except Exception as e:  # noqa: BLE001 — retried below
+            failures[drive_file_id] = e
+
+    uploaded = [drive_file_id for drive_file_id in futures if drive_file_id not in failures]
+    if uploaded:
+        try:
+            grant_errors = gdrive.grant_public_read(uploaded)
+        except Exception as e:  # noqa: BLE001 — the whole batch request failed
+            grant_errors = {drive_file_id: e for drive_file_id in uploaded}
+        for drive_file_id, error in grant_errors.items():
+            if error is not None:
+                failures[drive_file_id] = error
+
+    for entry in entries:
+        drive_file_id = entry["drive_file_id"]
+        if drive_file_id in failures:
+            counts[_retry_later(entry, failures[drive_file_id])] += 1
+        else:
+            oss_storage.delete(oss_storage.drive_queue_key(drive_file_id))
+            counts["archived"] += 1
+
+
+def drain(budget: float = DRIVE_ARCHIVE_DRAIN_SECONDS) -> dict[str, int]:
+    """
+    Archive queued files until the queue has nothing due or `budget` seconds
+    have passed. Returns counts of archived / retried / dead entries.
+    """
+    counts = {"archived": 0, "retried": 0, "dead": 0}
+    if not is_enabled() or not gdrive.is_authorized():
+        return counts  # nothing would succeed; leave entries and their attempts alone
+    deadline = time.monotonic() + budget
+    with ThreadPoolExecutor(max_workers=max(1, DRIVE_ARCHIVE_CONCURRENCY), thread_name_prefix="drive") as pool:
+        # Each round carries on after the last key scanned, so entries backing
+        # off at the front of the queue can't hide due ones behind them.
+        marker: str | None = ""
+        while marker is not None and time.monotonic() < deadline:
+            entries, marker = _due_entries(time.time(), marker, deadline)
+            if entries:
+                _drain_round(entries, pool, counts)
+    if any(counts.values()):
+        print(f"[GDrive] Archive drain: {counts}")
+    return counts
+
+
+async def adrain(budget: float = DRIVE_ARCHIVE_DRAIN_SECONDS) -> dict[str, int]:
+    """drain in a thread — the Drive and OSS SDKs are blocking."""
+    return await asyncio.to_thread(drain, budget)
+
+
+async def run_periodically() -> None:
+    """In-process drainer for deployments without a timer trigger. Runs forever."""
+    while True:
+        await asyncio.sleep(DRIVE_ARCHIVE_INTERVAL)
+        try:
+            await adrain()
+        except Exception as e:  # noqa: BLE001 — try again next interval
+            print(f"[GDrive] Archive drain failed: {e}")
@@ -10,8 +10,14 @@ Local dev (OSS/FC not configured):
     Fall back to an in-process asyncio background task — same behaviour as the
     original ECS design.
 
+Two-stage mode: with PDF_WORKER_FUNCTION and WORKER_FC_ENDPOINT set on the
+worker, WORKER_FUNCTION only runs the LLM stage and hands each job on to
+PDF_WORKER_FUNCTION, which only renders. The two functions can then be sized
+separately (see worker.py).
+
 Config (env):
     WORKER_FUNCTION      name of the worker function (enables async invoke)
+    PDF_WORKER_FUNCTION  optional separate function for the PDF stage
     WORKER_FC_ENDPOINT   account FC endpoint, e.g. <account>.<region>.fc.aliyuncs.com
     WORKER_FC_REGION     e.g. ap-southeast-1
 
@@ -27,6 +33,7 @@ import os
 from typing import Any
 
 FC_WORKER_FUNCTION = os.getenv("WORKER_FUNCTION", "")
+FC_PDF_WORKER_FUNCTION = os.getenv("PDF_WORKER_FUNCTION", "")
 FC_ENDPOINT = os.getenv("WORKER_FC_ENDPOINT", "")
 FC_REGION = os.getenv("WORKER_FC_REGION", "") or os.getenv("FC_REGION", "")
 
@@ -35,7 +42,21 @@ def _use_fc() -> bool:
     return bool(FC_WORKER_FUNCTION and FC_ENDPOINT)
 
 
-def _async_invoke_fc(job_id: str, payload: dict[str, Any]) -> None:
+def is_remote() -> bool:
+    """True when jobs run in the worker function rather than in this process."""
+    return _use_fc()
+
+
+def split_stages() -> bool:
+    """
+    True when the PDF stage runs in its own function (two-stage mode). Decided
+    on the worker, which needs only what submit_pdf_stage uses — not
+    WORKER_FUNCTION, which is set on the API function.
+    """
+    return bool(FC_PDF_WORKER_FUNCTION and FC_ENDPOINT)
+
+
+def _async_invoke_fc(job_id: str, payload: dict[str, Any], function: str = FC_WORKER_FUNCTION) -> None:
     """
     Fire-and-forget async invocation of the worker function via the FC 3.0
     OpenAPI. FC queues the invocation and returns immediately; credentials come
@@ -62,7 +83,7 @@ def _async_invoke_fc(job_id: str, payload: dict[str, Any]) -> None:
     # Queue it and return right away instead of blocking on the result.
     headers = fc_models.InvokeFunctionHeaders(x_fc_invocation_type="Async")
     client.invoke_function_with_options(
-        FC_WORKER_FUNCTION, request, headers, util_models.RuntimeOptions()
+        function, request, headers, util_models.RuntimeOptions()
     )
 
 
@@ -78,5 +99,10 @@ def submit_job(job_id: str, payload: dict[str, Any]) -> None:
         return
 
     # Local fallback: run in an in-process asyncio task.
-    from worker import run_resume_job
-    asyncio.create_task(asyncio.to_thread(run_resume_job, job_id, payload))
+    from worker import arun_job
+    asyncio.create_task(arun_job(job_id, payload))
+
+
+def submit_pdf_stage(job_id: str, payload: dict[str, Any]) -> None:
+    """Queue the PDF stage of a job on PDF_WORKER_FUNCTION. Only used when split_stages()."""
+    _async_invoke_fc(job_id, payload, FC_PDF_WORKER_FUNCTION)
@@ -7,13 +7,19 @@ First-time setup:
   3. All future uploads happen silently using the stored refresh token
 """
 
+import io
+import json
 import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
 from dotenv import load_dotenv
 
 import oss_storage
@@ -44,7 +50,9 @@ def _write_token(token_json: str) -> None:
 
 # Store the active flow so the callback can reuse the same instance (state must match)
 _active_flow: Flow | None = None
-_drive_service = None  # cached Drive API client; rebuilt when credentials change
+# Per-thread Drive API clients; bumping the generation makes every thread rebuild.
+_thread_services = threading.local()
+_service_generation = 0
 
 
 def get_auth_url() -> str:
@@ -76,109 +84,228 @@ def save_token_from_code(code: str) -> None:
     )
     flow.fetch_token(code=code)
     _write_token(flow.credentials.to_json())
+    with _creds_lock:
+        _use_credentials(flow.credentials)
     _active_flow = None
 
 
-def get_credentials() -> Credentials | None:
-    """Load and refresh stored credentials. Returns None if not authorized yet."""
-    global _drive_service
+# ── Credentials cache ─────────────────────────────────────────────────────────
+#
+# Credentials stay in memory; the token store is only read again when the
+# access token is within _EXPIRY_MARGIN of expiring, or (while unauthorized)
+# at most every _TOKEN_RECHECK seconds. A refresh is single-flight within the
+# process (_creds_lock) and across instances: the refresher holds a lease in
+# OSS while the others wait for the token it writes, rather than all
+# refreshing at once and racing to rewrite config/token.json.
+
+_EXPIRY_MARGIN = timedelta(minutes=5)
+_TOKEN_RECHECK = 60.0
+_LEASE_TTL = 30.0
+_LEASE_WAIT = 10.0
+
+_creds: Credentials | None = None
+_creds_lock = threading.Lock()
+_unauthorized_until = 0.0
+
+
+def _fresh(creds: Credentials) -> bool:
+    if not creds.token:
+        return False
+    if creds.expiry is None:
+        return True
+    # google-auth keeps expiry as naive UTC.
+    return creds.expiry - _EXPIRY_MARGIN > datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _stored_credentials() -> Credentials | None:
     token_json = _read_token()
     if not token_json:
         return None
-
-    import json
-    creds = Credentials.from_authorized_user_info(json.loads(token_json), SCOPES)
-
-    if creds and creds.expired and creds.refresh_token:
+    return Credentials.from_authorized_user_info(json.loads(token_json), SCOPES)
+
+
+def _use_credentials(creds: Credentials | None) -> Credentials | None:
+    global _creds, _service_generation, _unauthorized_until
+    if creds is not _creds:
+        _creds = creds
+        _service_generation += 1  # rebuild cached services with the new credentials
+    _unauthorized_until = 0.0 if creds else time.monotonic() + _TOKEN_RECHECK
+    return creds
+
+
+def _refresh(creds: Credentials) -> Credentials:
+    """Refresh creds, unless another instance does it first; returns the fresh ones."""
+    lease = not oss_storage.is_configured() or oss_storage.acquire_token_lease(_LEASE_TTL)
+    deadline = time.monotonic() + _LEASE_WAIT
+    while not lease:
+        time.sleep(0.5)
+        stored = _stored_credentials()
+        if stored and _fresh(stored):
+            return stored
+        if time.monotonic() >= deadline:
+            break  # the holder looks stuck; refresh without the lease
+        lease = oss_storage.acquire_token_lease(_LEASE_TTL)
+    try:
         creds.refresh(Request())
         _write_token(creds.to_json())
-        _drive_service = None  # invalidate cached service after credential refresh
+    finally:
+        if lease and oss_storage.is_configured():
+            oss_storage.release_token_lease()
+    return creds
 
-    return creds if creds and creds.valid else None
 
-
-def _get_drive_service():
-    """Return a cached Drive API client, building one if needed."""
-    global _drive_service
-    if _drive_service is None:
-        creds = get_credentials()
-        if not creds:
+def get_credentials() -> Credentials | None:
+    """Cached, refreshed credentials. Returns None if not authorized yet."""
+    creds = _creds
+    if creds is not None and _fresh(creds):
+        return creds
+    with _creds_lock:
+        if _creds is not None and _fresh(_creds):
+            return _creds  # another thread refreshed while we waited
+        if _creds is None and time.monotonic() < _unauthorized_until:
             return None
-        _drive_service = build("drive", "v3", credentials=creds)
-    return _drive_service
+        # Another instance may have refreshed (or re-authorized) already.
+        creds = _stored_credentials()
+        if creds and not _fresh(creds) and creds.refresh_token:
+            creds = _refresh(creds)
+        return _use_credentials(creds if creds and creds.valid else None)
 
 
-def upload_pdf_to_drive(pdf_path: Path) -> str | None:
+def _get_drive_service():
+    """
+    Return a cached Drive API client, building one if needed. The client's
+    httplib2 transport is not thread-safe, so each thread gets its own.
     """
-    Upload a PDF to Google Drive.
+    creds = get_credentials()  # in memory unless due for a refresh
+    if not creds:
+        return None
+    if getattr(_thread_services, "generation", None) != _service_generation:
+        _thread_services.service = build("drive", "v3", credentials=creds)
+        _thread_services.generation = _service_generation
+    return _thread_services.service
 
-    Returns:
-        Shareable link string, or None if upload fails.
+
+# ── Uploads ───────────────────────────────────────────────────────────────────
+#
+# Drive can hand out file ids before a file exists (files.generateIds). A job
+# reserves one from a small in-process pool, so its shareable link is known up
+# front and the upload itself can happen after the job is reported done (see
+# drive_archive). The reserved id also makes an upload idempotent: re-creating
+# it is a 409. create_file and grant_public_read are the two halves of an
+# upload, split so the archive queue can grant many files in one batch call.
+
+DRIVE_ID_BATCH = 20
+
+_reserved_ids: list[str] = []
+_reserved_ids_lock = threading.Lock()
+
+
+def drive_link(file_id: str) -> str:
+    return f"https://drive.google.com/file/d/{file_id}/view"
+
+
+def reserve_file_id() -> str | None:
+    """A Drive file id to upload to later, or None if Drive is not authorized."""
+    with _reserved_ids_lock:
+        if not _reserved_ids:
+            service = _get_drive_service()
+            if not service:
+                return None
+            response = service.files().generateIds(count=DRIVE_ID_BATCH, space="drive", type="files").execute()
+            _reserved_ids.extend(response.get("ids", []))
+        return _reserved_ids.pop() if _reserved_ids else None
+
+
+def create_file(data: bytes, name: str, mimetype: str, file_id: str | None = None) -> str | None:
+    """
+    Upload a file (not yet shared) and return its id, or None if Drive is not
+    authorized. With a reserved file_id, a file that already exists counts as
+    uploaded, so retries are harmless.
     """
     service = _get_drive_service()
     if not service:
         print("[GDrive] Not authorized. Visit /api/auth/google to authorize.")
         return None
 
-    file_metadata = {"name": pdf_path.name}
+    file_metadata = {"name": name}
+    if file_id:
+        file_metadata["id"] = file_id
     if GDRIVE_FOLDER_ID:
         file_metadata["parents"] = [GDRIVE_FOLDER_ID]
 
-    media = MediaFileUpload(str(pdf_path), mimetype="application/pdf")
-
-    uploaded = service.files().create(
-        body=file_metadata,
-        media_body=media,
-        fields="id",
-    ).execute()
+    media = MediaIoBaseUpload(io.BytesIO(data), mimetype=mimetype)
 
-    file_id = uploaded.get("id")
+    try:
+        uploaded = service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields="id",
+        ).execute()
+    except HttpError as e:
+        if file_id and e.resp.status == 409:
+            return file_id  # an earlier attempt already created it
+        raise
+    return uploaded.get("id")
 
-    # Make file viewable by anyone with the link
-    service.permissions().create(
-        fileId=file_id,
-        body={"type": "anyone", "role": "reader"},
-    ).execute()
 
-    return f"https://drive.google.com/file/d/{file_id}/view"
+_PUBLIC_READ = {"type": "anyone", "role": "reader"}
+_BATCH_LIMIT = 100  # calls per Drive batch request
 
 
-def upload_image_to_drive(image_path: Path) -> str | None:
+def grant_public_read(file_ids: list[str]) -> dict[str, Exception | None]:
     """
-    Upload a profile image to Google Drive.
-
-    Returns:
-        Shareable link string, or None if upload fails.
+    Make files viewable by anyone with the link, using one Drive batch request
+    per 100 files. Returns each id's error, or None where the grant succeeded.
+    Granting twice is harmless: Drive returns the existing permission.
     """
     service = _get_drive_service()
     if not service:
-        print("[GDrive] Not authorized. Visit /api/auth/google to authorize.")
+        return {file_id: RuntimeError("Google Drive is not authorized") for file_id in file_ids}
+
+    errors: dict[str, Exception | None] = {}
+
+    def _done(request_id, response, exception):
+        errors[request_id] = exception
+
+    for start in range(0, len(file_ids), _BATCH_LIMIT):
+        batch = service.new_batch_http_request(callback=_done)
+        for file_id in file_ids[start:start + _BATCH_LIMIT]:
+            batch.add(service.permissions().create(fileId=file_id, body=_PUBLIC_READ), request_id=file_id)
+        batch.execute()
+    return errors
+
+
+def _upload(data: bytes, name: str, mimetype: str, file_id: str | None = None) -> str | None:
+    file_id = create_file(data, name, mimetype, file_id)
+    if not file_id:
         return None
 
-    mimetype = "image/jpeg"
+    # Make file viewable by anyone with the link
+    _get_drive_service().permissions().create(fileId=file_id, body=_PUBLIC_READ).execute()
 
-    file_metadata = {"name": image_path.name}
-    if GDRIVE_FOLDER_ID:
-        file_metadata["parents"] = [GDRIVE_FOLDER_ID]
+    return drive_link(file_id)
 
-    media = MediaFileUpload(str(image_path), mimetype=mimetype)
 
-    uploaded = service.files().create(
-        body=file_metadata,
-        media_body=media,
-        fields="id",
-    ).execute()
+def upload_pdf_to_drive(pdf_bytes: bytes, name: str, file_id: str | None = None) -> str | None:
+    """
+    Upload an in-memory PDF to Google Drive, optionally under a reserved id.
 
-    file_id = uploaded.get("id")
+    Returns:
+        Shareable link string, or None if upload fails.
+    """
+    return _upload(pdf_bytes, name, "application/pdf", file_id)
 
-    service.permissions().create(
-        fileId=file_id,
-        body={"type": "anyone", "role": "reader"},
-    ).execute()
 
-    return f"https://drive.google.com/file/d/{file_id}/view"
+def upload_image_to_drive(image_bytes: bytes, name: str, file_id: str | None = None) -> str | None:
+    """
+    Upload an in-memory profile image (JPEG) to Google Drive.
+
+    Returns:
+        Shareable link string, or None if upload fails.
+    """
+    return _upload(image_bytes, name, "image/jpeg", file_id)
 
 
 def is_authorized() -> bool:
-    """Check if the app is authorized to access Google Drive."""
+    """Check if the app is authorized to access Google Drive (from the credentials cache)."""
     return get_credentials() is not None
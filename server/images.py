@@ -0,0 +1,171 @@
+"""
+Profile-photo processing for /api/upload-image.
+
+The largest photo any template shows is about 110 CSS px wide, yet phones
+upload 12–48 MP images; fully decoding a 48 MP HEIC costs ~150 MB of RAM.
+Instead the decoder is asked for a reduced image up front: JPEG decodes at
+1/2, 1/4 or 1/8 scale (draft mode), and HEIF uses an embedded thumbnail when
+one is large enough. The result is scaled to IMAGE_MAX_SIZE and stored as a
+progressive JPEG, small enough to inline and quick for Chromium to fetch.
+
+Decoding runs in a small dedicated thread pool, never on the event loop, and
+the pool size bounds how many decodes hold memory at once.
+
+At render time the stored photo is not fetched by Chromium at all: inline_src
+turns its URL into a data URI of a template-sized rendition (RENDITIONS).
+Renditions are keyed by the source's content hash (its OSS ETag) and cached
+in-process and in OSS under images/derived/, so each is built once per photo.
+
+Config (env):
+    IMAGE_MAX_SIZE      longest edge of the stored photo in px (default 600,
+                        ~4x the largest on-page size so print stays sharp)
+    IMAGE_QUALITY       JPEG quality (default 85)
+    IMAGE_WORKERS       concurrent decodes per instance (default 2)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO
+
+from PIL import Image, ImageOps
+import pillow_heif
+
+import oss_storage
+
+pillow_heif.register_heif_opener()
+
+IMAGE_MAX_SIZE = int(os.getenv("IMAGE_MAX_SIZE", "600"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+# Local-dev home for converted photos (OSS holds them in production). On
+# Function Compute only /tmp is writable.
+LOCAL_DIR = Path(tempfile.gettempdir()) / "images"
+LOCAL_DIR.mkdir(exist_ok=True)
+
+# Rendition name -> shorter edge in px. The largest photo box in any template
+# is 110 CSS px (template L); 3x that prints sharply and object-fit: cover crops
+# it to each template's box.
+RENDITIONS = {"print": 330}
+_RENDITION_QUALITY = 80
+_RENDITION_CACHE_MAX = 64
+
+_executor = ThreadPoolExecutor(max_workers=max(1, IMAGE_WORKERS), thread_name_prefix="image")
+
+
+def process_profile_image(stream: BinaryIO, max_size: int = IMAGE_MAX_SIZE) -> bytes:
+    """
+    Decode any supported upload (JPEG, PNG, WEBP, HEIC, ...) at reduced size
+    and return it as progressive JPEG bytes no larger than max_size on a side.
+    EXIF orientation is applied, so sideways phone photos come out upright.
+    """
+    with Image.open(stream) as img:
+        # thumbnail() first asks the decoder for a draft at >= 2x the target
+        # (JPEG DCT scaling / HEIF embedded thumbnail), then resamples down.
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=IMAGE_QUALITY, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+async def aprocess_profile_image(stream: BinaryIO, max_size: int = IMAGE_MAX_SIZE) -> bytes:
+    """process_profile_image on the image pool, so the event loop never runs PIL."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, process_profile_image, stream, max_size)
+
+
+# ── Renditions ────────────────────────────────────────────────────────────────
+
+_renditions: OrderedDict[str, bytes] = OrderedDict()
+_renditions_lock = threading.Lock()
+
+
+def make_rendition(data: bytes, rendition: str = "print") -> bytes:
+    """Scale a stored photo so its shorter edge is RENDITIONS[rendition] px (never up)."""
+    edge = RENDITIONS[rendition]
+    with Image.open(io.BytesIO(data)) as img:
+        scale = edge / min(img.size)
+        if scale < 1:
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            img.draft("RGB", size)
+            img = img.resize(size, Image.Resampling.LANCZOS)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=_RENDITION_QUALITY, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def _cached(digest: str, build) -> bytes:
+    with _renditions_lock:
+        if digest in _renditions:
+            _renditions.move_to_end(digest)
+            return _renditions[digest]
+    data = build()
+    with _renditions_lock:
+        _renditions[digest] = data
+        while len(_renditions) > _RENDITION_CACHE_MAX:
+            _renditions.popitem(last=False)
+    return data
+
+
+def rendition_bytes(url: str, rendition: str = "print") -> bytes | None:
+    """
+    Rendition of the photo at `url` — an object in our bucket, or a local-dev
+    ../images/ path. None for anything else (left for Chromium to fetch).
+    """
+    key = oss_storage.key_from_url(url) if oss_storage.is_configured() else None
+    if key:
+        etag = oss_storage.object_etag(key)
+        if etag is None:
+            return None
+        derived_key = oss_storage.derived_image_key(etag.strip('"'), rendition)
+
+        def _build() -> bytes:
+            data = oss_storage.get_bytes(derived_key)
+            if data is None:
+                data = make_rendition(oss_storage.get_bytes(key), rendition)
+                oss_storage.put_bytes(derived_key, data, "image/jpeg")
+            return data
+
+        return _cached(derived_key, _build)
+
+    if url.startswith("../images/"):
+        path = LOCAL_DIR / Path(url).name
+        if not path.is_file():
+            return None
+        source = path.read_bytes()
+        digest = f"{hashlib.sha256(source).hexdigest()}-{rendition}"
+        return _cached(digest, lambda: make_rendition(source, rendition))
+
+    return None
+
+
+def inline_src(url: str | None, rendition: str = "print") -> str | None:
+    """
+    A data: URI of the photo's rendition for an <img src>, so the PDF render
+    makes no network fetch for it. Falls back to the URL itself on any error.
+    """
+    if not url or url.startswith("data:"):
+        return url
+    try:
+        data = rendition_bytes(url, rendition)
+    except Exception as e:  # noqa: BLE001 — Chromium can still fetch the original
+        print(f"  [Image] Rendition failed, using original URL: {e}")
+        return url
+    if data is None:
+        return url
+    return "data:image/jpeg;base64," + base64.b64encode(data).decode()
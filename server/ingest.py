@@ -0,0 +1,336 @@
+"""
+Bulk CSV / JSONL ingest.
+
+An ingest job streams a file of resumes row by row and runs every valid row
+through the same two phases as a single job (LLM enhancement, then PDF),
+appending one result line per row to a manifest. The file is never loaded
+whole: rows are pulled from a generator only when a pipeline slot is free, so
+memory stays flat however long the file is.
+
+Input formats (each row has the CreateResumeRequest shape):
+  jsonl  one object per line: {"resume": {...}, "template": "A", "language": "English"}
+  csv    header row; a `resume` column holding the resume as JSON, plus
+         optional `template` / `language` columns
+
+Files live in OSS (ingest/<id>/input.<fmt>, ingest/<id>/manifest.jsonl), or
+under the temp dir in local dev. Manifest lines look like
+  {"row": 3, "status": "done", "file_id": ..., "pdf_url": ..., "drive_url": ...}
+  {"row": 4, "status": "failed", "error": "..."}
+A retried invocation reads the manifest back and skips rows already recorded.
+
+Config (env):
+    INGEST_LLM_CONCURRENCY   rows in the LLM phase at once (default 8)
+    INGEST_PDF_CONCURRENCY   rows in the PDF phase at once (default 2)
+    INGEST_MAX_BYTES         upload size cap (default 100 MB)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import codecs
+import csv
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Iterable, Iterator
+
+import jobstore
+import oss_storage
+from create_resume import DRIVE_ARCHIVE, apipeline_phase1_llm, apipeline_phase2_pdf, archive_pdf
+from schemas import CreateResumeRequest
+
+INGEST_LLM_CONCURRENCY = int(os.getenv("INGEST_LLM_CONCURRENCY", "8"))
+INGEST_PDF_CONCURRENCY = int(os.getenv("INGEST_PDF_CONCURRENCY", "2"))
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(100 * 1024 * 1024)))
+
+FORMATS = ("csv", "jsonl")
+
+_MANIFEST_FLUSH_LINES = 50
+_MANIFEST_FLUSH_SECONDS = 5.0
+_LOCAL_DIR = Path(tempfile.gettempdir()) / "ingest"
+
+
+# ── Input ─────────────────────────────────────────────────────────────────────
+
+def input_location(ingest_id: str, fmt: str) -> str:
+    """OSS key, or local file path in dev, the ingest input is stored at."""
+    if oss_storage.is_configured():
+        return oss_storage.ingest_input_key(ingest_id, fmt)
+    return str(_LOCAL_DIR / ingest_id / f"input.{fmt}")
+
+
+class InputTooLarge(ValueError):
+    """The uploaded ingest file is bigger than INGEST_MAX_BYTES."""
+
+
+class _LimitedReader:
+    """
+    Counts bytes as they are read and raises InputTooLarge past the limit, so
+    an upload of unknown length (chunked) is capped while it streams. It has
+    no seek/tell, so oss2 uploads it chunked rather than sizing it up front.
+    """
+
+    def __init__(self, stream: BinaryIO, limit: int):
+        self._stream = stream
+        self._limit = limit
+        self._remaining = limit
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._stream.read(size)
+        self._remaining -= len(chunk)
+        if self._remaining < 0:
+            raise InputTooLarge(f"Ingest file is larger than {self._limit} bytes.")
+        return chunk
+
+
+def store_input(ingest_id: str, fmt: str, stream: BinaryIO) -> str:
+    """
+    Save an uploaded ingest file without reading it into memory; returns its
+    location. Raises InputTooLarge (nothing is kept) past INGEST_MAX_BYTES.
+    """
+    location = input_location(ingest_id, fmt)
+    stream = _LimitedReader(stream, INGEST_MAX_BYTES)
+    if oss_storage.is_configured():
+        oss_storage.put_stream(location, stream, "text/csv" if fmt == "csv" else "application/x-ndjson")
+    else:
+        Path(location).parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(location, "wb") as f:
+                while chunk := stream.read(64 * 1024):
+                    f.write(chunk)
+        except InputTooLarge:
+            Path(location).unlink(missing_ok=True)
+            raise
+    return location
+
+
+def _iter_input_chunks(location: str) -> Iterator[bytes]:
+    if oss_storage.is_configured():
+        yield from oss_storage.iter_chunks(location)
+        return
+    with open(location, "rb") as f:
+        while chunk := f.read(64 * 1024):
+            yield chunk
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Decode UTF-8 (with or without BOM) chunks into lines, keeping line endings."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    for chunk in chunks:
+        # Split on "\n" only: str.splitlines would also break on characters
+        # such as U+2028 that may legitimately sit inside a JSON string.
+        *lines, pending = (pending + decoder.decode(chunk)).split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def iter_rows(lines: Iterable[str], fmt: str) -> Iterator[tuple[int, dict[str, Any] | Exception]]:
+    """
+    Yield (row_number, row) for each data row, numbered from 1. A row that
+    cannot be parsed is yielded as the exception so the rest still run.
+    """
+    if fmt == "jsonl":
+        row_number = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield row_number, ValueError(f"invalid JSON: {e}")
+                continue
+            if not isinstance(row, dict):
+                yield row_number, ValueError(f"expected a JSON object, got {type(row).__name__}")
+                continue
+            yield row_number, row
+        return
+
+    for row_number, raw in enumerate(csv.DictReader(lines), start=1):
+        try:
+            row: dict[str, Any] = {"resume": json.loads(raw.get("resume") or "")}
+        except json.JSONDecodeError as e:
+            yield row_number, ValueError(f"invalid JSON in resume column: {e}")
+            continue
+        for field in ("template", "language"):
+            if raw.get(field):
+                row[field] = raw[field].strip()
+        yield row_number, row
+
+
+# ── Manifest ──────────────────────────────────────────────────────────────────
+
+class Manifest:
+    """
+    Append-only JSONL of per-row results. Lines are buffered and flushed in
+    groups (one OSS append per flush); the job record's counters are updated
+    at the same time.
+    """
+
+    def __init__(self, ingest_id: str):
+        self.ingest_id = ingest_id
+        self.counts = {"done": 0, "failed": 0}
+        self.recorded_rows: set[int] = set()
+        self._buffer: list[str] = []
+        self._flushed_at = time.monotonic()
+        self._lock = asyncio.Lock()
+        if oss_storage.is_configured():
+            self.location = oss_storage.ingest_manifest_key(ingest_id)
+        else:
+            self.location = str(_LOCAL_DIR / ingest_id / "manifest.jsonl")
+        self._position = 0
+
+    def load(self) -> None:
+        """Read back what an earlier attempt recorded, so those rows are skipped."""
+        try:
+            if oss_storage.is_configured():
+                if not oss_storage.exists(self.location):
+                    return
+                lines = iter_lines(oss_storage.iter_chunks(self.location))
+            else:
+                if not Path(self.location).exists():
+                    return
+                lines = iter_lines(_iter_input_chunks(self.location))
+            for line in lines:
+                self._position += len(line.encode())
+                if line.strip():
+                    entry = json.loads(line)
+                    self.recorded_rows.add(entry["row"])
+                    self.counts[entry["status"]] += 1
+        except Exception as e:  # noqa: BLE001 — a torn manifest just means re-running rows
+            print(f"[Ingest {self.ingest_id}] could not read existing manifest: {e}")
+
+    async def write(self, entry: dict[str, Any]) -> None:
+        async with self._lock:
+            self.counts[entry["status"]] += 1
+            self._buffer.append(json.dumps(entry, ensure_ascii=False) + "\n")
+            due = time.monotonic() - self._flushed_at >= _MANIFEST_FLUSH_SECONDS
+            if len(self._buffer) >= _MANIFEST_FLUSH_LINES or due:
+                await self._flush()
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        lines, self._buffer = self._buffer, []
+        self._flushed_at = time.monotonic()
+        if lines:
+            await asyncio.to_thread(self._append, "".join(lines).encode())
+        try:
+            await asyncio.to_thread(
+                jobstore.update_job, self.ingest_id,
+                processed=self.counts["done"] + self.counts["failed"], failed=self.counts["failed"],
+            )
+        except Exception as e:  # noqa: BLE001
+            print(f"[Ingest {self.ingest_id}] progress write failed: {e}")
+
+    def _append(self, data: bytes) -> None:
+        if oss_storage.is_configured():
+            self._position = oss_storage.append_bytes(
+                self.location, self._position, data, "application/x-ndjson"
+            )
+        else:
+            Path(self.location).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.location, "ab") as f:
+                f.write(data)
+
+
+def iter_manifest(ingest_id: str) -> Iterator[bytes]:
+    """Stream a manifest's raw bytes (for the download endpoint)."""
+    if oss_storage.is_configured():
+        yield from oss_storage.iter_chunks(oss_storage.ingest_manifest_key(ingest_id))
+    else:
+        yield from _iter_input_chunks(str(_LOCAL_DIR / ingest_id / "manifest.jsonl"))
+
+
+# ── Runner ────────────────────────────────────────────────────────────────────
+
+async def arun_ingest_job(ingest_id: str, payload: dict[str, Any]) -> None:
+    """
+    Worker entry point for an ingest job. payload keys: input (OSS key or
+    local path), format ("csv" | "jsonl").
+
+    The LLM and PDF phases have separate limits, so while some rows wait on
+    Chromium others are already being enhanced. At most
+    INGEST_LLM_CONCURRENCY + INGEST_PDF_CONCURRENCY rows are held at once.
+    """
+    started_at = time.time()
+    await asyncio.to_thread(jobstore.update_job, ingest_id, status="processing", started_at=started_at)
+
+    manifest = Manifest(ingest_id)
+    await asyncio.to_thread(manifest.load)
+    rows = iter_rows(iter_lines(_iter_input_chunks(payload["input"])), payload["format"])
+
+    llm_slots = asyncio.Semaphore(max(1, INGEST_LLM_CONCURRENCY))
+    pdf_slots = asyncio.Semaphore(max(1, INGEST_PDF_CONCURRENCY))
+    in_flight = asyncio.Semaphore(max(1, INGEST_LLM_CONCURRENCY) + max(1, INGEST_PDF_CONCURRENCY))
+    tasks: set[asyncio.Task] = set()
+
+    async def _process(row_number: int, row: dict[str, Any] | Exception) -> None:
+        try:
+            if isinstance(row, Exception):
+                raise row
+            request = CreateResumeRequest.model_validate(row)
+            async with llm_slots:
+                _, html_content, file_id = await apipeline_phase1_llm(
+                    resume_data=request.resume,
+                    template_key=request.template,
+                    language=request.language,
+                )
+            async with pdf_slots:
+                result = await apipeline_phase2_pdf(
+                    html_content, file_id, defer_drive=DRIVE_ARCHIVE == "deferred"
+                )
+            pending = result.pop("drive_pending", None)
+            if pending is not None:
+                await asyncio.to_thread(archive_pdf, pending)
+            entry = {"row": row_number, "status": "done", "file_id": file_id,
+                     "pdf_url": result.get("pdf_url"), "drive_url": result.get("drive_url")}
+        except Exception as e:  # noqa: BLE001 — one bad row never stops the file
+            entry = {"row": row_number, "status": "failed", "error": str(e)[:500]}
+        finally:
+            in_flight.release()
+        await manifest.write(entry)
+
+    _end = object()
+    try:
+        while True:
+            await in_flight.acquire()
+            # Reading the next row may block on OSS / disk.
+            item = await asyncio.to_thread(next, rows, _end)
+            if item is _end:
+                in_flight.release()
+                break
+            row_number, row = item
+            if row_number in manifest.recorded_rows:
+                in_flight.release()
+                continue
+            task = asyncio.create_task(_process(row_number, row))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        await manifest.close()
+    except Exception as e:  # noqa: BLE001 — e.g. the input vanished or is not UTF-8
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await manifest.close()
+        except Exception as close_error:  # noqa: BLE001
+            print(f"[Ingest {ingest_id}] manifest flush failed: {close_error}")
+        await asyncio.to_thread(
+            jobstore.update_job, ingest_id, status="failed", error=str(e),
+            elapsed=round(time.time() - started_at, 3),
+        )
+        return
+
+    await asyncio.to_thread(
+        jobstore.update_job, ingest_id, status="done",
+        processed=manifest.counts["done"] + manifest.counts["failed"], failed=manifest.counts["failed"],
+        elapsed=round(time.time() - started_at, 3),
+    )
@@ -3,37 +3,455 @@ Job store abstraction.
 
 Production: backed by OSS (jobs/<id>.json) so the poll request and the worker
 invocation — which run on different Function Compute instances — share state.
+Reads go through a small in-process cache: `done`/`failed` records never change
+and are cached indefinitely; in-progress records are re-used for
+JOB_CACHE_TTL seconds, then revalidated with a conditional GET so an
+unchanged record costs a 304 instead of a body download.
 
-Local dev (OSS not configured): a plain in-process dict, matching the original
-ECS behaviour where the background task and the poller live in one process.
+Local dev / docker-compose (OSS not configured): an in-process LocalJobStore,
+matching the original ECS behaviour where the background task and the poller
+live in one process. It is bounded: records expire LOCAL_JOB_TTL seconds after
+their last update, and past LOCAL_JOB_MAX_ENTRIES the least recently used one
+is evicted — to the SQLite file at LOCAL_JOB_SPILL_PATH if set, else dropped.
+
+get_jobs fetches many records at once (batch status endpoint): cached records
+are answered without a request, the rest are fetched JOB_BATCH_CONCURRENCY at
+a time.
+
+claim_fingerprint coalesces identical submissions: the first request for a
+given payload owns the fingerprint, and repeats within JOB_DEDUP_TTL are handed
+the same job (in flight or finished) instead of starting new work.
+
+save_handoff/load_handoff carry a job from the LLM stage to the PDF stage
+when those run as separate worker functions (see worker.py).
+
+Batches (bulk orders) are a parent job plus one ordinary job per resume;
+save_batch/load_batch hold the item list the batch worker reads.
+
+wait_for_change backs the long-poll and SSE endpoints: locally it is woken
+directly by update_job; against OSS it re-reads with adaptive backoff.
 """
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
 import oss_storage
 
-# In-memory fallback for local development only.
-_jobs: dict[str, dict[str, Any]] = {}
+# Seconds a non-terminal record is served from cache before revalidating.
+JOB_CACHE_TTL = float(os.getenv("JOB_CACHE_TTL", "2"))
+# Max records held in the read cache (LRU).
+JOB_CACHE_MAX_ENTRIES = int(os.getenv("JOB_CACHE_MAX_ENTRIES", "2000"))
+
+# Long-poll re-read interval against OSS: starts fast, backs off to the max.
+WAIT_MIN_INTERVAL = float(os.getenv("JOB_WAIT_MIN_INTERVAL", "0.5"))
+WAIT_MAX_INTERVAL = float(os.getenv("JOB_WAIT_MAX_INTERVAL", "3"))
+
+# Parallel OSS GETs per get_jobs call.
+JOB_BATCH_CONCURRENCY = int(os.getenv("JOB_BATCH_CONCURRENCY", "8"))
+
+# Local store bounds: expiry after the last update, in-memory LRU capacity, and
+# an optional SQLite file evicted records spill to (empty = drop them).
+LOCAL_JOB_TTL = float(os.getenv("LOCAL_JOB_TTL", "86400"))
+LOCAL_JOB_MAX_ENTRIES = int(os.getenv("LOCAL_JOB_MAX_ENTRIES", "500"))
+LOCAL_JOB_SPILL_PATH = os.getenv("LOCAL_JOB_SPILL_PATH", "")
+
+# Seconds a submitted payload keeps pointing at its job. Must stay below
+# OSS_SIGNED_URL_TTL so a reused result still has a working pdf_url.
+JOB_DEDUP_TTL = float(os.getenv("JOB_DEDUP_TTL", "600"))
+# A fingerprint whose job record does not exist yet is treated as in flight
+# for this long (claimed, create_job not yet written).
+_DEDUP_CLAIM_GRACE = 30.0
+
+TERMINAL_STATUSES = ("done", "failed")
+
+
+class LocalJobStore:
+    """
+    Bounded in-process job store. Records live in an LRU keyed by job_id with
+    an expiry refreshed on every write; a job being worked on is written at
+    each stage, so eviction lands on finished, idle records first. With a
+    spill path, evicted records move to SQLite and are promoted back on read.
+    """
+
+    def __init__(
+        self,
+        ttl: float = LOCAL_JOB_TTL,
+        max_entries: int = LOCAL_JOB_MAX_ENTRIES,
+        spill_path: str = LOCAL_JOB_SPILL_PATH,
+    ):
+        self._ttl = ttl
+        self._max_entries = max(1, max_entries)
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self._spills = 0
+        if spill_path:
+            self._db = sqlite3.connect(spill_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, expires_at REAL, record TEXT)"
+            )
+            self._db.execute("DELETE FROM jobs WHERE expires_at < ?", (time.time(),))
+
+    def get(self, job_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            entry = self._entries.get(job_id)
+            if entry is not None:
+                expires_at, record = entry
+                if expires_at < time.time():
+                    del self._entries[job_id]
+                    return None
+                self._entries.move_to_end(job_id)
+                return record
+            record = self._unspill(job_id)
+            if record is not None:
+                self._put(job_id, record)
+            return record
+
+    def set(self, job_id: str, record: dict[str, Any]) -> None:
+        with self._lock:
+            self._put(job_id, record)
+
+    def update(self, job_id: str, fields: dict[str, Any]) -> None:
+        with self._lock:
+            entry = self._entries.get(job_id)
+            if entry is None:
+                record = self._unspill(job_id)
+            elif entry[0] < time.time():
+                # Expired but not yet swept: a new record, as get() would see it.
+                del self._entries[job_id]
+                record = None
+            else:
+                record = entry[1]
+            if record is None:
+                record = {"created_at": time.time()}
+            record.update(fields)
+            self._put(job_id, record)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # Callers hold self._lock.
+
+    def _put(self, job_id: str, record: dict[str, Any]) -> None:
+        now = time.time()
+        self._entries[job_id] = (now + self._ttl, record)
+        self._entries.move_to_end(job_id)
+        while len(self._entries) > self._max_entries:
+            evicted_id, (expires_at, evicted) = self._entries.popitem(last=False)
+            if self._db is not None and expires_at >= now:
+                self._spill(evicted_id, expires_at, evicted)
+
+    def _spill(self, job_id: str, expires_at: float, record: dict[str, Any]) -> None:
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, expires_at, record) VALUES (?, ?, ?)",
+                (job_id, expires_at, json.dumps(record, ensure_ascii=False)),
+            )
+            self._spills += 1
+            if self._spills % 256 == 0:  # keep the file from growing without bound
+                self._db.execute("DELETE FROM jobs WHERE expires_at < ?", (time.time(),))
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"[Jobs] spill of {job_id} failed: {e}")
+
+    def _unspill(self, job_id: str) -> dict[str, Any] | None:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT expires_at, record FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        except sqlite3.Error as e:
+            print(f"[Jobs] spill read of {job_id} failed: {e}")
+            return None
+        expires_at, raw = row
+        return json.loads(raw) if expires_at >= time.time() else None
+
+
+# In-process store for local development / single-box deployments.
+_local = LocalJobStore()
+
+# Local-mode fingerprints: fingerprint -> {"job_id", "created_at"}.
+_local_fingerprints = LocalJobStore(ttl=JOB_DEDUP_TTL, max_entries=LOCAL_JOB_MAX_ENTRIES, spill_path="")
+_fingerprint_lock = threading.Lock()
+
+# Local-mode batch item lists: batch_id -> {"items": [...]}.
+_local_batches = LocalJobStore(max_entries=max(1, LOCAL_JOB_MAX_ENTRIES // 10), spill_path="")
+
+# Local-mode stage handoffs: job_id -> handoff dict.
+_local_handoffs = LocalJobStore(max_entries=max(1, LOCAL_JOB_MAX_ENTRIES // 10), spill_path="")
+
+# Local-mode waiters: job_id -> {(loop, event)}, woken by update_job. Updates
+# arrive from worker threads, so events are set via call_soon_threadsafe.
+_waiters: dict[str, set[tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+_waiters_lock = threading.Lock()
+
+# OSS read cache: job_id -> (fetched_at, etag, record)
+_cache: OrderedDict[str, tuple[float, str | None, dict[str, Any]]] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_get(job_id: str) -> tuple[float, str | None, dict[str, Any]] | None:
+    with _cache_lock:
+        entry = _cache.get(job_id)
+        if entry is not None:
+            _cache.move_to_end(job_id)
+        return entry
+
+
+def _cache_put(job_id: str, etag: str | None, record: dict[str, Any]) -> None:
+    with _cache_lock:
+        _cache[job_id] = (time.monotonic(), etag, record)
+        _cache.move_to_end(job_id)
+        while len(_cache) > JOB_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def _cache_drop(job_id: str) -> None:
+    with _cache_lock:
+        _cache.pop(job_id, None)
+
+
+def _get_job_cached(job_id: str) -> dict[str, Any] | None:
+    entry = _cache_get(job_id)
+    etag = None
+    if entry is not None:
+        fetched_at, etag, record = entry
+        if record.get("status") in TERMINAL_STATUSES:
+            return record
+        if time.monotonic() - fetched_at < JOB_CACHE_TTL:
+            return record
+
+    changed, record, etag = oss_storage.get_job_if_changed(job_id, etag)
+    if not changed:
+        record = entry[2]  # 304: our copy is still current
+    if record is None:
+        _cache_drop(job_id)
+        return None
+    _cache_put(job_id, etag, record)
+    return record
 
 
 def create_job(job_id: str) -> None:
     if oss_storage.is_configured():
         oss_storage.create_job(job_id)
+        _cache_drop(job_id)
     else:
-        _jobs[job_id] = {"status": "pending", "result": None, "error": None, "created_at": time.time()}
+        _local.set(job_id, {"status": "pending", "result": None, "error": None, "created_at": time.time()})
 
 
 def get_job(job_id: str) -> dict[str, Any] | None:
     if oss_storage.is_configured():
-        return oss_storage.get_job(job_id)
-    return _jobs.get(job_id)
+        return _get_job_cached(job_id)
+    return _local.get(job_id)
+
+
+def create_jobs(job_ids: list[str]) -> None:
+    """create_job for many ids, JOB_BATCH_CONCURRENCY writes at a time. Blocking."""
+    if not oss_storage.is_configured() or len(job_ids) <= 1:
+        for job_id in job_ids:
+            create_job(job_id)
+        return
+    workers = min(JOB_BATCH_CONCURRENCY, len(job_ids))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job-batch") as pool:
+        list(pool.map(create_job, job_ids))
+
+
+def get_jobs(job_ids: list[str]) -> dict[str, dict[str, Any] | None]:
+    """Fetch several jobs at once; unknown ids map to None. Blocking — call via to_thread."""
+    job_ids = list(dict.fromkeys(job_ids))
+    if not oss_storage.is_configured():
+        return {job_id: _local.get(job_id) for job_id in job_ids}
+    if len(job_ids) <= 1:
+        return {job_id: _get_job_cached(job_id) for job_id in job_ids}
+    workers = min(JOB_BATCH_CONCURRENCY, len(job_ids))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job-batch") as pool:
+        return dict(zip(job_ids, pool.map(_get_job_cached, job_ids)))
 
 
 def update_job(job_id: str, **fields: Any) -> None:
     if oss_storage.is_configured():
         oss_storage.update_job(job_id, **fields)
+        _cache_drop(job_id)
+    else:
+        _local.update(job_id, fields)
+        _notify(job_id)
+
+
+# ── Stage handoff ─────────────────────────────────────────────────────────────
+
+def save_handoff(job_id: str, handoff: dict[str, Any]) -> None:
+    """Store phase 1's output (enhanced resume, HTML, file_id, ...) for the PDF stage."""
+    if oss_storage.is_configured():
+        oss_storage.put_handoff(job_id, handoff)
+    else:
+        _local_handoffs.set(job_id, handoff)
+
+
+def load_handoff(job_id: str) -> dict[str, Any] | None:
+    if oss_storage.is_configured():
+        return oss_storage.get_handoff(job_id)
+    return _local_handoffs.get(job_id)
+
+
+# ── Batches ───────────────────────────────────────────────────────────────────
+
+def save_batch(batch_id: str, items: list[dict[str, Any]]) -> None:
+    """Store a batch's items: [{"job_id", "payload"}, ...]."""
+    if oss_storage.is_configured():
+        oss_storage.put_batch(batch_id, items)
     else:
-        _jobs.setdefault(job_id, {"created_at": time.time()}).update(fields)
+        _local_batches.set(batch_id, {"items": items})
+
+
+def load_batch(batch_id: str) -> list[dict[str, Any]] | None:
+    if oss_storage.is_configured():
+        return oss_storage.get_batch(batch_id)
+    record = _local_batches.get(batch_id)
+    return record["items"] if record else None
+
+
+# ── Request dedup ─────────────────────────────────────────────────────────────
+
+def _stable_payload(payload: dict[str, Any]) -> dict[str, Any]:
+    """
+    The payload minus what differs between identical submissions: the client
+    gives every submit a random resume `id`, and re-uploading the same photo
+    returns a freshly signed `image` URL, so the image counts by its OSS key.
+    """
+    resume = payload.get("resume")
+    if not isinstance(resume, dict):
+        return payload
+    resume = {k: v for k, v in resume.items() if k != "id"}
+    image = resume.get("image")
+    if isinstance(image, str):
+        resume["image"] = oss_storage.key_from_url(image) or image
+    return {**payload, "resume": resume}
+
+
+def job_fingerprint(payload: dict[str, Any]) -> str:
+    """Stable hash of a job payload (resume, template, language, ...)."""
+    canonical = json.dumps(_stable_payload(payload), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _reusable(claim: dict[str, Any] | None) -> str | None:
+    """The claimed job_id if that job can stand in for a new submission."""
+    if not claim:
+        return None
+    age = time.time() - claim.get("created_at", 0)
+    if age > JOB_DEDUP_TTL:
+        return None
+    job = get_job(claim["job_id"])
+    if job is None:
+        return claim["job_id"] if age < _DEDUP_CLAIM_GRACE else None
+    return claim["job_id"] if job.get("status") != "failed" else None
+
+
+def claim_fingerprint(fingerprint: str, job_id: str) -> str | None:
+    """
+    Register `job_id` as the job for `fingerprint`. Returns None when the
+    caller now owns it and should create + dispatch the job, or the id of an
+    equivalent pending/processing/done job to hand back instead. Failed and
+    expired jobs are replaced. Blocking — call via to_thread.
+    """
+    claim = {"job_id": job_id, "created_at": time.time()}
+
+    if not oss_storage.is_configured():
+        with _fingerprint_lock:
+            existing = _reusable(_local_fingerprints.get(fingerprint))
+            if existing:
+                return existing
+            _local_fingerprints.set(fingerprint, claim)
+            return None
+
+    key = oss_storage.dedup_key(fingerprint)
+    data = json.dumps(claim).encode()
+    # Exclusive create, so two instances racing on a double-click can't both win.
+    if oss_storage.put_bytes_if_absent(key, data, "application/json"):
+        return None
+    raw = oss_storage.get_bytes(key)
+    existing = _reusable(json.loads(raw) if raw else None)
+    if existing:
+        return existing
+    oss_storage.put_bytes(key, data, "application/json")  # stale claim: take it over
+    return None
+
+
+# ── Waiting for changes ───────────────────────────────────────────────────────
+
+def job_marker(job: dict[str, Any] | None) -> tuple[str | None, str | None]:
+    """What a waiter compares: the job's status and latest pipeline stage."""
+    if not job:
+        return None, None
+    return job.get("status"), job.get("stage")
+
+
+def _settled(job: dict[str, Any], seen: tuple[str | None, str | None]) -> bool:
+    """True when a waiter should stop waiting: the job moved on, or it is finished."""
+    return job_marker(job) != seen or job.get("status") in TERMINAL_STATUSES
+
+
+def _notify(job_id: str) -> None:
+    with _waiters_lock:
+        waiters = list(_waiters.get(job_id, ()))
+    for loop, event in waiters:
+        loop.call_soon_threadsafe(event.set)
+
+
+async def wait_for_change(
+    job_id: str,
+    seen: tuple[str | None, str | None],
+    timeout: float,
+) -> dict[str, Any] | None:
+    """
+    Return the job as soon as job_marker(job) differs from `seen` or the job
+    is finished, else the current record once `timeout` seconds pass.
+    Returns None if the job is gone.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    if not oss_storage.is_configured():
+        event = asyncio.Event()
+        entry = (loop, event)
+        with _waiters_lock:
+            _waiters.setdefault(job_id, set()).add(entry)
+        try:
+            while True:
+                event.clear()
+                job = _local.get(job_id)
+                remaining = deadline - loop.time()
+                if job is None or _settled(job, seen) or remaining <= 0:
+                    return job
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with _waiters_lock:
+                _waiters.get(job_id, set()).discard(entry)
+                if not _waiters.get(job_id):
+                    _waiters.pop(job_id, None)
+
+    interval = WAIT_MIN_INTERVAL
+    while True:
+        job = await asyncio.to_thread(get_job, job_id)
+        remaining = deadline - loop.time()
+        if job is None or _settled(job, seen) or remaining <= 0:
+            return job
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * 1.5, WAIT_MAX_INTERVAL)
@@ -0,0 +1,146 @@
+"""
+Content-addressed cache for LLM responses.
+
+The enhancers call gpt-4o-mini at temperature 0, so an identical prompt gets
+an identical answer — and users regenerate the same resume just to try another
+template. Responses are keyed on a hash of (model, temperature, fully rendered
+prompt messages); the rendered messages already combine the prompt template
+and its inputs, so either changing invalidates the entry.
+
+Tiers (checked in order, a lower-tier hit is copied into the tiers above it):
+  - memory   in-process LRU with TTL — hits within one warm instance
+  - oss      llm-cache/<hash>.json via oss_storage — shared across FC instances;
+             enabled whenever OSS is configured
+
+Config (env):
+    LLM_CACHE              "off" disables caching entirely (default "on")
+    LLM_CACHE_TTL          seconds an entry stays valid (default 86400)
+    LLM_CACHE_MAX_ENTRIES  in-process LRU capacity (default 512)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import oss_storage
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "on").lower() not in ("off", "0", "false")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))  # 1 day
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+
+
+def make_key(model: str, temperature: float, messages: list[tuple[str, str]]) -> str:
+    """Hash the model settings and rendered (role, content) messages into a cache key."""
+    normalized = [
+        [role, "\n".join(line.rstrip() for line in content.strip().splitlines())]
+        for role, content in messages
+    ]
+    payload = json.dumps(
+        {"model": model, "temperature": temperature, "messages": normalized},
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class MemoryBackend:
+    """Thread-safe LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES, ttl: int = LLM_CACHE_TTL):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + self._ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+class OSSBackend:
+    """Shared tier in OSS. Expiry is checked on read; a lifecycle rule on the
+    llm-cache/ prefix should clean up the objects themselves."""
+
+    def __init__(self, ttl: int = LLM_CACHE_TTL):
+        self._ttl = ttl
+
+    def get(self, key: str) -> str | None:
+        raw = oss_storage.get_bytes(oss_storage.llm_cache_key(key))
+        if not raw:
+            return None
+        record = json.loads(raw)
+        if record.get("created_at", 0) + self._ttl < time.time():
+            return None
+        return record.get("value")
+
+    def set(self, key: str, value: str) -> None:
+        record = {"value": value, "created_at": time.time()}
+        oss_storage.put_bytes(
+            oss_storage.llm_cache_key(key),
+            json.dumps(record, ensure_ascii=False).encode(),
+            "application/json",
+        )
+
+
+class LLMCache:
+    """Read-through over the configured tiers. Backend errors never fail a job."""
+
+    def __init__(self, backends: list):
+        self._backends = backends
+
+    def get(self, key: str) -> str | None:
+        for i, backend in enumerate(self._backends):
+            try:
+                value = backend.get(key)
+            except Exception as e:  # noqa: BLE001 — a cache miss, not a failure
+                print(f"  [LLMCache] {type(backend).__name__} read failed: {e}")
+                continue
+            if value is not None:
+                for upper in self._backends[:i]:
+                    upper.set(key, value)
+                return value
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        for backend in self._backends:
+            try:
+                backend.set(key, value)
+            except Exception as e:  # noqa: BLE001
+                print(f"  [LLMCache] {type(backend).__name__} write failed: {e}")
+
+
+_cache: LLMCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> LLMCache | None:
+    """Process-wide cache, or None when LLM_CACHE=off."""
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            backends: list = [MemoryBackend()]
+            if oss_storage.is_configured():
+                backends.append(OSSBackend())
+            _cache = LLMCache(backends)
+        return _cache
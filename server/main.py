@@ -1,17 +1,16 @@
 from fastapi import FastAPI, Form, HTTPException, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 from typing import Any
 from pathlib import Path
 import asyncio
+import json
 import uvicorn
 import os
 import uuid
 from PIL import Image
-import pillow_heif
-pillow_heif.register_heif_opener()
 
 from dotenv import load_dotenv
 load_dotenv(Path(__file__).parent.parent / ".env")
@@ -21,18 +20,18 @@ if _missing_env:
     raise RuntimeError(f"Missing required environment variables: {', '.join(_missing_env)}")
 
 from create_resume import get_llm
-from gdrive import get_auth_url, save_token_from_code, is_authorized, upload_image_to_drive
+from gdrive import drive_link, get_auth_url, reserve_file_id, save_token_from_code, is_authorized, upload_image_to_drive
+import drive_archive
 import jobstore
 import fc_async
+import images
+import ingest
 import oss_storage
-from worker import run_resume_job
+from worker import arun_job
+from schemas import CreateResumeRequest
 
-# Ephemeral scratch dir for image conversion. On Function Compute only /tmp is
-# writable; the converted JPEG is uploaded to OSS + Google Drive and the local
-# copy is discarded within the same request.
-import tempfile
-IMAGES_DIR = Path(tempfile.gettempdir()) / "images"
-IMAGES_DIR.mkdir(exist_ok=True)
+# Local-dev home for converted profile images (OSS holds them in production).
+IMAGES_DIR = images.LOCAL_DIR
 
 
 app = FastAPI(
@@ -63,10 +62,37 @@ async def add_security_headers(request: Request, call_next):
     return response
 
 
-class CreateResumeRequest(BaseModel):
-    resume: dict[str, Any]
+_archive_drainer: asyncio.Task | None = None
+
+
+@app.on_event("startup")
+async def start_archive_drainer():
+    """
+    Drain the Drive archive queue in-process where nothing else will. On
+    Function Compute (FC_FUNCTION_NAME is injected there) a timer trigger on
+    the worker does it, and an instance is frozen between requests anyway.
+    """
+    global _archive_drainer
+    if drive_archive.is_enabled() and not fc_async.is_remote() and not os.getenv("FC_FUNCTION_NAME"):
+        _archive_drainer = asyncio.create_task(drive_archive.run_periodically())
+
+
+# Resumes per bulk order; one worker invocation renders them all.
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+
+
+class CreateResumeBatchRequest(BaseModel):
+    resumes: list[CreateResumeRequest] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+
+class RerenderResumeRequest(BaseModel):
+    job_id: str = Field(..., max_length=100)
     template: str = Field("A", pattern=r"^[A-M]$")
-    language: str = Field("English", max_length=20)
+    language: str | None = Field(None, max_length=20)
+
+
+class BatchStatusRequest(BaseModel):
+    job_ids: list[str] = Field(..., max_length=100)
 
 
 class GenerateProfileRequest(BaseModel):
@@ -89,6 +115,31 @@ class LogOrderRequest(BaseModel):
     imageLink: str = Field("", max_length=500)
 
 
+async def _start_job(payload: dict[str, Any]) -> dict[str, Any]:
+    """
+    Create a job for `payload` and dispatch it to the worker. An identical
+    payload submitted within JOB_DEDUP_TTL (double-click, resubmit) gets the
+    existing job back — `deduplicated: true` — instead of new LLM + PDF work.
+    """
+    job_id = str(uuid.uuid4())
+    fingerprint = jobstore.job_fingerprint(payload)
+    try:
+        existing = await asyncio.to_thread(jobstore.claim_fingerprint, fingerprint, job_id)
+    except Exception as e:  # noqa: BLE001 — dedup is an optimisation; never block a submit
+        print(f"[Jobs] fingerprint claim failed: {e}")
+        existing = None
+    if existing:
+        return {"job_id": existing, "deduplicated": True}
+
+    jobstore.create_job(job_id)
+    try:
+        fc_async.submit_job(job_id, payload)
+    except Exception as e:
+        jobstore.update_job(job_id, status="failed", error=f"Could not start job: {e}")
+        raise HTTPException(status_code=502, detail="Could not start resume generation.")
+    return {"job_id": job_id}
+
+
 @app.post("/api/create-resume")
 async def create_resume(request: CreateResumeRequest):
     """
@@ -96,19 +147,166 @@ async def create_resume(request: CreateResumeRequest):
     The heavy LLM + Playwright pipeline runs in a separate Function Compute
     async invocation (see fc_async.submit_job); progress is written to the OSS
     job store. Poll GET /api/resume-status/{job_id} to track it.
+    Resubmitting the same resume/template/language returns the same job_id.
     """
-    job_id = str(uuid.uuid4())
-    jobstore.create_job(job_id)
+    return await _start_job({
+        "resume": request.resume,
+        "template": request.template,
+        "language": request.language,
+    })
+
+
+@app.post("/api/create-resume-batch")
+async def create_resume_batch(request: CreateResumeBatchRequest):
+    """
+    Start a bulk order: one job per resume, all run by a single worker
+    invocation that shares one warm Chromium across them (see
+    worker.arun_batch_job). Returns the batch_id and the per-resume job_ids
+    in request order; track them with GET /api/resume-batch/{batch_id} and
+    POST /api/resume-status/batch.
+    """
+    batch_id = str(uuid.uuid4())
+    items = [
+        {
+            "job_id": str(uuid.uuid4()),
+            "payload": {"resume": r.resume, "template": r.template, "language": r.language},
+        }
+        for r in request.resumes
+    ]
+    job_ids = [item["job_id"] for item in items]
+
+    def _prepare():
+        jobstore.save_batch(batch_id, items)
+        jobstore.create_jobs(job_ids)
+        jobstore.create_job(batch_id)
+        jobstore.update_job(batch_id, total=len(items), completed=0, failed=0)
+
+    await asyncio.to_thread(_prepare)
     try:
-        fc_async.submit_job(job_id, {
-            "resume": request.resume,
-            "template": request.template,
-            "language": request.language,
-        })
+        fc_async.submit_job(batch_id, {"batch": True})
     except Exception as e:
-        jobstore.update_job(job_id, status="failed", error=f"Could not start job: {e}")
-        raise HTTPException(status_code=502, detail="Could not start resume generation.")
-    return {"job_id": job_id}
+        jobstore.update_job(batch_id, status="failed", error=f"Could not start batch: {e}")
+        raise HTTPException(status_code=502, detail="Could not start batch generation.")
+    return {"batch_id": batch_id, "job_ids": job_ids}
+
+
+@app.get("/api/resume-batch/{batch_id}")
+async def resume_batch_status(batch_id: str):
+    """Bulk-order progress: counts of finished and failed resumes out of the total."""
+    batch = await asyncio.to_thread(jobstore.get_job, batch_id)
+    if not batch or "total" not in batch:
+        raise HTTPException(status_code=404, detail="Batch not found or expired.")
+    response = {
+        "status": batch["status"],
+        "total": batch["total"],
+        "completed": batch.get("completed", 0),
+        "failed": batch.get("failed", 0),
+    }
+    if batch.get("elapsed") is not None:
+        response["elapsed"] = batch["elapsed"]
+    if batch["status"] == "failed":
+        response["error"] = batch.get("error")
+    return response
+
+
+@app.post("/api/ingest")
+async def start_ingest(
+    file: UploadFile | None = File(None),
+    oss_key: str | None = Form(None, max_length=500),
+    input_format: str | None = Form(None, alias="format", pattern=r"^(csv|jsonl)$"),
+):
+    """
+    Start a bulk CSV/JSONL ingest (see ingest.py for the row format). Post the
+    file itself, or the `oss_key` of one already uploaded to the bucket under
+    ingest/ (no other prefix is accepted); the format comes from the file
+    extension unless given. Returns an ingest_id: track it with
+    GET /api/ingest/{ingest_id}, fetch per-row results from
+    GET /api/ingest/{ingest_id}/manifest. Files over INGEST_MAX_BYTES are
+    refused with 413, whether or not their size is known up front.
+    """
+    if (file is None) == (oss_key is None):
+        raise HTTPException(status_code=400, detail="Send either a file or an oss_key.")
+    name = file.filename if file is not None else oss_key
+    fmt = input_format or Path(name or "").suffix.lower().lstrip(".")
+    if fmt not in ingest.FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be csv or jsonl.")
+
+    ingest_id = str(uuid.uuid4())
+    if file is not None:
+        if file.size is not None and file.size > ingest.INGEST_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Ingest file is too large.")
+        try:
+            location = await asyncio.to_thread(ingest.store_input, ingest_id, fmt, file.file)
+        except ingest.InputTooLarge:
+            raise HTTPException(status_code=413, detail="Ingest file is too large.")
+    else:
+        # Never let a caller point the pipeline at tokens, jobs or PDFs.
+        if not oss_storage.is_ingest_key(oss_key):
+            raise HTTPException(status_code=400, detail="oss_key must be under ingest/.")
+        if not oss_storage.is_configured() or not await asyncio.to_thread(oss_storage.exists, oss_key):
+            raise HTTPException(status_code=404, detail="oss_key not found.")
+        location = oss_key
+
+    jobstore.create_job(ingest_id)
+    jobstore.update_job(ingest_id, processed=0, failed=0)
+    try:
+        fc_async.submit_job(ingest_id, {"ingest": True, "input": location, "format": fmt})
+    except Exception as e:
+        jobstore.update_job(ingest_id, status="failed", error=f"Could not start ingest: {e}")
+        raise HTTPException(status_code=502, detail="Could not start ingest.")
+    return {"ingest_id": ingest_id}
+
+
+@app.get("/api/ingest/{ingest_id}")
+async def ingest_status(ingest_id: str):
+    """Ingest progress: rows processed so far and how many of them failed."""
+    job = await asyncio.to_thread(jobstore.get_job, ingest_id)
+    if not job or "processed" not in job:
+        raise HTTPException(status_code=404, detail="Ingest not found or expired.")
+    response = {"status": job["status"], "processed": job["processed"], "failed": job.get("failed", 0)}
+    if job.get("elapsed") is not None:
+        response["elapsed"] = job["elapsed"]
+    if job["status"] == "failed":
+        response["error"] = job.get("error")
+    return response
+
+
+@app.get("/api/ingest/{ingest_id}/manifest")
+async def ingest_manifest(ingest_id: str):
+    """Per-row results so far, as JSON lines (streamed, not buffered)."""
+    chunks = ingest.iter_manifest(ingest_id)
+    try:
+        first = await asyncio.to_thread(next, chunks, b"")
+    except Exception:
+        raise HTTPException(status_code=404, detail="No manifest yet.")
+
+    async def _stream():
+        yield first
+        while chunk := await asyncio.to_thread(next, chunks, b""):
+            yield chunk
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
+
+@app.post("/api/rerender-resume")
+async def rerender_resume(request: RerenderResumeRequest):
+    """
+    Re-render a finished job's resume with another template (and optionally
+    another language layout) without re-running the LLM enhancement.
+    Returns a new job_id; poll it exactly like /api/create-resume.
+    """
+    source = jobstore.get_job(request.job_id)
+    if not source:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    result = source.get("result") or {}
+    if source["status"] != "done" or not result.get("enhanced_data"):
+        raise HTTPException(status_code=409, detail="Job has no finished resume to re-render.")
+
+    return await _start_job({
+        "source_job_id": request.job_id,
+        "template": request.template,
+        "language": request.language or result.get("language", "English"),
+    })
 
 
 @app.post("/invoke")
@@ -119,22 +317,26 @@ async def invoke(request: Request):
     Not exposed publicly — only the worker function's event trigger hits this.
     """
     event = await request.json()
+    if "triggerName" in event:
+        # Timer trigger (see DEPLOYMENT_FC.md): drain the Drive archive queue.
+        return {"ok": True, "archive": await drive_archive.adrain()}
     job_id = event["job_id"]
     payload = event["payload"]
-    # Run the (blocking) pipeline off the event loop.
-    await asyncio.to_thread(run_resume_job, job_id, payload)
+    # Async pipeline: LLM calls and the Chromium render are awaited, not threaded.
+    await arun_job(job_id, payload)
     return {"ok": True, "job_id": job_id}
 
 
-@app.get("/api/resume-status/{job_id}")
-async def resume_status(job_id: str):
-    """Poll this endpoint every few seconds after calling /api/create-resume."""
-    job = jobstore.get_job(job_id)
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found or expired.")
-
+def _status_response(job: dict[str, Any]) -> dict[str, Any]:
+    """Public view of a job record: status, stage progress, and the result or error."""
     response: dict[str, Any] = {"status": job["status"]}
 
+    if job.get("stage"):
+        response["stage"] = job["stage"]          # latest completed pipeline stage
+        response["stages"] = job.get("stages", [])  # [{"stage", "elapsed"}, ...]
+    if job.get("elapsed") is not None:
+        response["elapsed"] = job["elapsed"]
+
     if job["status"] == "done":
         result = job["result"] or {}
         response["pdf_url"] = result.get("pdf_url")      # signed OSS download URL
@@ -147,6 +349,100 @@ async def resume_status(job_id: str):
     return response
 
 
+@app.get("/api/resume-status/{job_id}")
+async def resume_status(job_id: str):
+    """Poll this endpoint every few seconds after calling /api/create-resume."""
+    job = jobstore.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return _status_response(job)
+
+
+@app.post("/api/resume-status/batch")
+async def resume_status_batch(request: BatchStatusRequest):
+    """
+    Status for many jobs in one request (order history, ops dashboard).
+    Returns {"jobs": {job_id: status}} with the same fields as
+    /api/resume-status minus the per-stage timings; unknown or expired jobs
+    map to null.
+    """
+    jobs = await asyncio.to_thread(jobstore.get_jobs, request.job_ids)
+    statuses: dict[str, Any] = {}
+    for job_id, job in jobs.items():
+        if not job:
+            statuses[job_id] = None
+            continue
+        status = _status_response(job)
+        status.pop("stages", None)
+        statuses[job_id] = status
+    return {"jobs": statuses}
+
+
+# Long-poll / SSE limits. FC's API function timeout is 60 s, so a held request
+# or stream must end before that; clients simply ask again (EventSource
+# reconnects on its own).
+LONG_POLL_MAX_WAIT = float(os.getenv("LONG_POLL_MAX_WAIT", "25"))
+SSE_MAX_DURATION = float(os.getenv("SSE_MAX_DURATION", "50"))
+_SSE_KEEPALIVE = 15.0  # stops proxies closing an idle stream
+
+
+@app.get("/api/resume-status/{job_id}/wait")
+async def resume_status_wait(
+    job_id: str,
+    status: str | None = None,
+    stage: str | None = None,
+    timeout: float = LONG_POLL_MAX_WAIT,
+):
+    """
+    Long-poll variant of /api/resume-status. Pass the status/stage from the
+    previous response; the request is held until either changes (or `timeout`
+    seconds, capped at LONG_POLL_MAX_WAIT, pass) and then returns the same body
+    as /api/resume-status. Returns immediately for a finished job.
+    """
+    timeout = max(0.0, min(timeout, LONG_POLL_MAX_WAIT))
+    job = await jobstore.wait_for_change(job_id, (status, stage), timeout)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return _status_response(job)
+
+
+@app.get("/api/resume-events/{job_id}")
+async def resume_events(job_id: str):
+    """
+    Stream job progress as server-sent events instead of polling.
+    Emits a `progress` event on every stage transition and closes after the
+    `done`/`failed` event (or after SSE_MAX_DURATION; the client reconnects).
+    """
+    job = await asyncio.to_thread(jobstore.get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+
+    async def _stream():
+        nonlocal job
+        deadline = loop.time() + SSE_MAX_DURATION
+        yield f"event: progress\ndata: {json.dumps(_status_response(job))}\n\n"
+        while job["status"] not in jobstore.TERMINAL_STATUSES:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            seen = jobstore.job_marker(job)
+            latest = await jobstore.wait_for_change(job_id, seen, min(_SSE_KEEPALIVE, remaining))
+            if not latest:
+                return
+            if jobstore.job_marker(latest) == seen:
+                yield ": keep-alive\n\n"
+                continue
+            job = latest
+            yield f"event: progress\ndata: {json.dumps(_status_response(job))}\n\n"
+
+    loop = asyncio.get_running_loop()
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/api/generate-profile")
 async def generate_profile(request: GenerateProfileRequest):
     """Generate AI-suggested resume profile (about me, skills, strengths) for a given job title."""
@@ -174,7 +470,7 @@ async def generate_profile(request: GenerateProfileRequest):
 
     try:
         llm = get_llm()
-        response = await asyncio.to_thread(llm.invoke, prompt)
+        response = await llm.ainvoke(prompt)
         import json, re
         text = response.content.strip()
         # strip markdown fences if model adds them despite instructions
@@ -240,7 +536,7 @@ async def auth_status():
     return {"authorized": is_authorized()}
 
 
-IMAGE_MAX_BYTES = 15 * 1024 * 1024  # 15 MB cap before PIL decode
+IMAGE_MAX_BYTES = 15 * 1024 * 1024  # 15 MB cap on the raw upload
 
 
 @app.post("/api/upload-image")
@@ -250,52 +546,61 @@ async def upload_image(image: UploadFile = File(...), phone: str = Form(...)):
     if not phone_clean:
         raise HTTPException(status_code=400, detail="Phone number is required")
 
-    # Save raw upload to a temp file first, enforcing a size cap.
-    # A raw HEIC from a 48 MP phone can decompress to ~150 MB in RAM —
-    # rejecting files over 15 MB keeps peak PIL memory under ~60 MB.
-    raw_suffix = Path(image.filename).suffix.lower() or ".jpg"
-    raw_path = IMAGES_DIR / f"{phone_clean}_raw{raw_suffix}"
-    written = 0
-    try:
-        with open(raw_path, "wb") as f:
-            while chunk := image.file.read(64 * 1024):
-                written += len(chunk)
-                if written > IMAGE_MAX_BYTES:
-                    raise HTTPException(status_code=413, detail="Image must be under 15 MB")
-                f.write(chunk)
-    except HTTPException:
-        raw_path.unlink(missing_ok=True)
-        raise
-
-    # Convert to JPEG (handles JPG, PNG, WEBP, HEIC, HEIF, etc.)
-    image_path = IMAGES_DIR / f"{phone_clean}.jpg"
+    # The multipart parser has already spooled the upload; check its size
+    # before decoding anything.
+    size = image.size
+    if size is None:
+        size = image.file.seek(0, os.SEEK_END)
+        image.file.seek(0)
+    if size > IMAGE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Image must be under 15 MB")
+
+    # Reduced-size decode + progressive JPEG re-encode on the image pool
+    # (handles JPG, PNG, WEBP, HEIC, HEIF, etc.) — a few MB of RAM, not ~150.
     try:
-        with Image.open(raw_path) as img:
-            img = img.convert("RGB")
-            img.save(image_path, format="JPEG", quality=90)
-    finally:
-        raw_path.unlink(missing_ok=True)
+        jpeg_bytes = await images.aprocess_profile_image(image.file)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise HTTPException(status_code=400, detail="Unsupported or corrupt image")
+    image_name = f"{phone_clean}.jpg"
 
     # Upload the JPEG to OSS and return an absolute URL. The PDF render happens
     # in a *separate* worker invocation, so the profile image must be reachable
     # over HTTPS (Chromium loads it by URL) rather than by local relative path.
-    drive_image_url = ""  # shareable Google Drive link, later logged to the sheet
-    try:
-        if oss_storage.is_configured():
-            key = oss_storage.put_image(phone_clean, image_path)
-            image_url = oss_storage.signed_url(key)
-        else:
-            image_url = f"../images/{phone_clean}.jpg"  # local-dev fallback
-
-        # Also archive a copy to Google Drive (best-effort) and keep its link.
+    if oss_storage.is_configured():
+        # The Drive copy is archived later by drive_archive; only its id is
+        # reserved here (usually from the in-process pool), next to the OSS put.
+        async def _reserve() -> str | None:
+            try:
+                return await asyncio.to_thread(reserve_file_id)
+            except Exception as e:
+                print(f"[GDrive] Could not reserve a file id: {e}")
+                return None
+
+        key, drive_file_id = await asyncio.gather(
+            asyncio.to_thread(oss_storage.put_image, phone_clean, jpeg_bytes), _reserve()
+        )
+        image_url = oss_storage.signed_url(key)
+        drive_image_url = ""
+        if drive_file_id:
+            try:
+                await asyncio.to_thread(drive_archive.enqueue, drive_file_id, image_name, "image/jpeg", key)
+                drive_image_url = drive_link(drive_file_id)
+            except Exception as e:
+                print(f"[GDrive] Could not queue image archive: {e}")
+        return {"success": True, "image_url": image_url, "drive_image_url": drive_image_url}
+
+    # Local dev: write to disk and upload to Drive (best-effort) alongside.
+    async def _archive() -> str:
         try:
-            drive_image_url = upload_image_to_drive(image_path) or ""
+            return await asyncio.to_thread(upload_image_to_drive, jpeg_bytes, image_name) or ""
         except Exception as e:
             print(f"[GDrive] Image upload failed: {e}")
-    finally:
-        # Discard the ephemeral local copy once uploaded.
-        if oss_storage.is_configured():
-            image_path.unlink(missing_ok=True)
+            return ""
+
+    _, drive_image_url = await asyncio.gather(
+        asyncio.to_thread((IMAGES_DIR / image_name).write_bytes, jpeg_bytes), _archive()
+    )
+    image_url = f"../images/{image_name}"  # local-dev fallback
 
     return {"success": True, "image_url": image_url, "drive_image_url": drive_image_url}
 
@@ -6,10 +6,21 @@ statelessly on Function Compute, where every request may hit a different,
 short-lived instance and local disk does not persist.
 
 What lives in OSS:
-  - jobs/<job_id>.json     resume-generation job status + result (the poll target)
+  - jobs/<job_id>.jsonl    resume-generation job status + result (the poll target),
+                           an append-only log of field updates
   - config/token.json      Google Drive OAuth token (survives cold starts)
   - images/<phone>.jpg     uploaded profile photos
+  - images/derived/<etag>-<rendition>.jpg  template-sized copies (see images.py)
   - pdf/<file_id>.pdf       generated resume PDFs (auto-expired by an OSS lifecycle rule)
+  - pdf/<hash>.pdf         the same, content-addressed by rendered HTML (PDF cache)
+  - llm-cache/<hash>.json  cached LLM enhancer responses (see llm_cache.py)
+  - dedup/<hash>.json      request fingerprint -> job_id, for coalescing resubmits
+  - ingest/<id>/input.*    uploaded CSV/JSONL bulk-ingest file
+  - ingest/<id>/manifest.jsonl  per-row ingest results (see ingest.py)
+  - handoff/<job_id>.json  enhanced resume + HTML passed from the LLM stage to
+                           the PDF stage when they run as separate functions
+  - batches/<id>.json      bulk-order item list (job_id + payload per resume) read
+                           by the batch worker; too large for an FC event body
 
 Credentials:
   On Function Compute, the function's RAM role injects temporary STS credentials
@@ -21,9 +32,11 @@ from __future__ import annotations
 
 import json
 import os
+import threading
 import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any
+from typing import Any, BinaryIO, Iterator
 
 # oss2 is imported lazily (inside functions) so local dev without the Alibaba
 # SDK installed can still run using the on-disk fallbacks in jobstore/gdrive.
@@ -35,8 +48,17 @@ OSS_PUBLIC_ENDPOINT = os.getenv("OSS_PUBLIC_ENDPOINT", OSS_ENDPOINT)  # used for
 
 _JOB_PREFIX = "jobs/"
 _TOKEN_KEY = "config/token.json"
+_TOKEN_LEASE_KEY = "config/token.lease"
 _IMAGE_PREFIX = "images/"
+_DERIVED_IMAGE_PREFIX = "images/derived/"
 _PDF_PREFIX = "pdf/"
+_LLM_CACHE_PREFIX = "llm-cache/"
+_DEDUP_PREFIX = "dedup/"
+_BATCH_PREFIX = "batches/"
+_HANDOFF_PREFIX = "handoff/"
+_INGEST_PREFIX = "ingest/"
+_DRIVE_QUEUE_PREFIX = "drive-queue/"
+_DRIVE_DEAD_PREFIX = "drive-queue-dead/"
 
 # Signed-URL lifetime for PDFs handed back to the browser (seconds).
 SIGNED_URL_TTL = int(os.getenv("OSS_SIGNED_URL_TTL", "7200"))  # 2 hours
@@ -110,6 +132,22 @@ def put_file(key: str, local_path: str | Path, content_type: str | None = None)
     _get_bucket().put_object_from_file(key, str(local_path), headers=headers)
 
 
+def put_bytes_if_absent(key: str, data: bytes, content_type: str | None = None) -> bool:
+    """Create the object only if the key is free. False if it already exists."""
+    import oss2
+    headers = {"x-oss-forbid-overwrite": "true"}
+    if content_type:
+        headers["Content-Type"] = content_type
+    try:
+        _get_bucket().put_object(key, data, headers=headers)
+    except oss2.exceptions.ServerError as e:
+        # oss2 has no subclass for this 409, so it arrives as a bare ServerError.
+        if e.status == 409 and e.code == "FileAlreadyExists":
+            return False
+        raise
+    return True
+
+
 def get_bytes(key: str) -> bytes | None:
     import oss2
     try:
@@ -119,35 +157,260 @@ def get_bytes(key: str) -> bytes | None:
         return None
 
 
+def get_bytes_if_changed(key: str, etag: str | None = None) -> tuple[bool, bytes | None, str | None]:
+    """
+    Conditional GET. Returns (changed, data, etag).
+
+    With an etag, OSS answers 304 if the object is unchanged; that comes back
+    as (False, None, etag) and costs no body download. A missing object is
+    (True, None, None).
+    """
+    import oss2
+    headers = {"If-None-Match": etag} if etag else None
+    try:
+        result = _get_bucket().get_object(key, headers=headers)
+        return True, result.read(), result.etag
+    except oss2.exceptions.NotModified:
+        return False, None, etag
+    except oss2.exceptions.NotFound:
+        return True, None, None
+
+
+def put_stream(key: str, stream: BinaryIO, content_type: str | None = None) -> None:
+    """Upload from a file-like object; oss2 reads it in chunks, never whole."""
+    headers = {"Content-Type": content_type} if content_type else None
+    _get_bucket().put_object(key, stream, headers=headers)
+
+
+def iter_chunks(key: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Stream an object's body in chunks. Raises if the object does not exist."""
+    body = _get_bucket().get_object(key)
+    while chunk := body.read(chunk_size):
+        yield chunk
+
+
+def append_bytes(key: str, position: int, data: bytes, content_type: str | None = None) -> int:
+    """
+    Append to an appendable object at `position`; returns the next position.
+    If the object has grown past `position`, the data goes after it instead.
+    """
+    import oss2
+    headers = {"Content-Type": content_type} if content_type else None
+    try:
+        return _get_bucket().append_object(key, position, data, headers=headers).next_position
+    except oss2.exceptions.PositionNotEqualToLength as e:
+        return _get_bucket().append_object(key, e.next_position, data, headers=headers).next_position
+
+
 def exists(key: str) -> bool:
     return _get_bucket().object_exists(key)
 
 
-def signed_url(key: str, ttl: int = SIGNED_URL_TTL) -> str:
-    """A time-limited HTTPS URL the browser can use to download the object."""
-    return _get_public_bucket().sign_url("GET", key, ttl, slash_safe=True)
+def delete(key: str) -> None:
+    _get_bucket().delete_object(key)
+
+
+def list_keys(prefix: str, limit: int | None = None, marker: str = "") -> list[str]:
+    """Keys under `prefix` in lexical order after `marker`, at most `limit` of them."""
+    import oss2
+    keys = []
+    for obj in oss2.ObjectIterator(_get_bucket(), prefix=prefix, marker=marker, max_keys=min(limit or 1000, 1000)):
+        keys.append(obj.key)
+        if limit is not None and len(keys) >= limit:
+            break
+    return keys
+
+
+def object_etag(key: str) -> str | None:
+    """ETag (content hash) of an object via HEAD, or None if it does not exist."""
+    import oss2
+    try:
+        return _get_bucket().head_object(key).etag
+    except oss2.exceptions.NotFound:
+        return None
+
+
+def object_last_modified(key: str) -> float | None:
+    """Last-Modified of an object (epoch seconds) via HEAD, or None if it does not exist."""
+    import oss2
+    try:
+        return float(_get_bucket().head_object(key).last_modified)
+    except oss2.exceptions.NotFound:
+        return None
+
+
+def touch(key: str, content_type: str | None = None) -> None:
+    """
+    Reset an object's Last-Modified (and so its lifecycle expiry) with a
+    server-side copy onto itself; nothing is downloaded.
+    """
+    headers = {"x-oss-metadata-directive": "REPLACE"}
+    if content_type:
+        headers["Content-Type"] = content_type
+    _get_bucket().copy_object(OSS_BUCKET, key, key, headers=headers)
+
+
+def signed_url(key: str, ttl: int = SIGNED_URL_TTL, filename: str | None = None) -> str:
+    """
+    A time-limited HTTPS URL the browser can use to download the object.
+    `filename` sets the name the browser saves it under, for keys (like
+    content-addressed PDFs) whose own name means nothing to the user.
+    """
+    params = {"response-content-disposition": f'inline; filename="{filename}"'} if filename else None
+    return _get_public_bucket().sign_url("GET", key, ttl, params=params, slash_safe=True)
+
+
+def key_from_url(url: str) -> str | None:
+    """The object key behind a (signed) URL to this bucket, or None for any other URL."""
+    from urllib.parse import unquote, urlsplit
+    parts = urlsplit(url)
+    hosts = {f"{OSS_BUCKET}.{e.split('://')[-1].rstrip('/')}" for e in (OSS_ENDPOINT, OSS_PUBLIC_ENDPOINT)}
+    if parts.scheme not in ("http", "https") or parts.hostname not in hosts:
+        return None
+    return unquote(parts.path.lstrip("/")) or None
 
 
 # ── Job store (replaces the in-memory _jobs dict) ─────────────────────────────
+#
+# A job record is an OSS *appendable* object of JSON lines. Every create/update
+# appends one line holding just the changed fields; readers merge the lines in
+# order. A status change is therefore a single write with no read first, and
+# two writers can never clobber each other: OSS rejects an append at a stale
+# offset (PositionNotEqualToLength, which reports the real offset) and we retry
+# there. Each process remembers the next offset per job, so the worker's
+# sequence of updates normally costs exactly one request each. The offsets are
+# a bounded LRU (dropped on a job's final write too): jobs created here but
+# finished by another instance never see that write, and a forgotten offset
+# only costs one extra request.
+
+_JOB_APPEND_RETRIES = 5
+_JOB_POSITIONS_MAX = 1024
+_job_positions: OrderedDict[str, int] = OrderedDict()
+_job_positions_lock = threading.Lock()
+
 
 def job_key(job_id: str) -> str:
-    return f"{_JOB_PREFIX}{job_id}.json"
+    return f"{_JOB_PREFIX}{job_id}.jsonl"
+
+
+def _append_job_fields(job_id: str, fields: dict[str, Any]) -> None:
+    import oss2
+    with _job_positions_lock:
+        position = _job_positions.get(job_id, 0)
+
+    for _ in range(_JOB_APPEND_RETRIES):
+        # The first line of a new record also carries created_at.
+        line = {"created_at": time.time(), **fields} if position == 0 else fields
+        try:
+            result = _get_bucket().append_object(
+                job_key(job_id), position, (json.dumps(line) + "\n").encode(),
+                headers={"Content-Type": "application/x-ndjson"},
+            )
+        except oss2.exceptions.PositionNotEqualToLength as e:
+            position = e.next_position  # someone else appended first — go after them
+            continue
+        with _job_positions_lock:
+            if fields.get("status") in ("done", "failed"):
+                _job_positions.pop(job_id, None)  # final write; don't keep the offset around
+            else:
+                _job_positions[job_id] = result.next_position
+                _job_positions.move_to_end(job_id)
+                while len(_job_positions) > _JOB_POSITIONS_MAX:
+                    _job_positions.popitem(last=False)
+        return
+
+    raise RuntimeError(f"Job {job_id}: gave up appending after {_JOB_APPEND_RETRIES} conflicting writes.")
+
+
+def _merge_job_lines(raw: bytes) -> dict[str, Any]:
+    record: dict[str, Any] = {}
+    for line in raw.splitlines():
+        if line.strip():
+            record.update(json.loads(line))
+    return record
 
 
 def create_job(job_id: str) -> None:
-    record = {"status": "pending", "result": None, "error": None, "created_at": time.time()}
-    put_bytes(job_key(job_id), json.dumps(record).encode(), "application/json")
+    _append_job_fields(job_id, {"status": "pending", "result": None, "error": None})
 
 
 def get_job(job_id: str) -> dict[str, Any] | None:
     raw = get_bytes(job_key(job_id))
-    return json.loads(raw) if raw else None
+    return _merge_job_lines(raw) if raw else None
+
+
+def get_job_if_changed(job_id: str, etag: str | None = None) -> tuple[bool, dict[str, Any] | None, str | None]:
+    """Conditional get_job — see get_bytes_if_changed for the return shape."""
+    changed, raw, new_etag = get_bytes_if_changed(job_key(job_id), etag)
+    return changed, (_merge_job_lines(raw) if raw else None), new_etag
 
 
 def update_job(job_id: str, **fields: Any) -> None:
-    record = get_job(job_id) or {"created_at": time.time()}
-    record.update(fields)
-    put_bytes(job_key(job_id), json.dumps(record).encode(), "application/json")
+    """Record changed fields with a single append — no read-modify-write."""
+    _append_job_fields(job_id, fields)
+
+
+# ── LLM response cache ────────────────────────────────────────────────────────
+
+def llm_cache_key(digest: str) -> str:
+    return f"{_LLM_CACHE_PREFIX}{digest}.json"
+
+
+# ── Batch manifests ───────────────────────────────────────────────────────────
+
+def put_batch(batch_id: str, items: list[dict[str, Any]]) -> None:
+    put_bytes(f"{_BATCH_PREFIX}{batch_id}.json", json.dumps(items, ensure_ascii=False).encode(), "application/json")
+
+
+def get_batch(batch_id: str) -> list[dict[str, Any]] | None:
+    raw = get_bytes(f"{_BATCH_PREFIX}{batch_id}.json")
+    return json.loads(raw) if raw else None
+
+
+# ── Stage handoff ─────────────────────────────────────────────────────────────
+
+def put_handoff(job_id: str, handoff: dict[str, Any]) -> None:
+    put_bytes(f"{_HANDOFF_PREFIX}{job_id}.json", json.dumps(handoff, ensure_ascii=False).encode(), "application/json")
+
+
+def get_handoff(job_id: str) -> dict[str, Any] | None:
+    raw = get_bytes(f"{_HANDOFF_PREFIX}{job_id}.json")
+    return json.loads(raw) if raw else None
+
+
+# ── Bulk ingest ───────────────────────────────────────────────────────────────
+
+def ingest_input_key(ingest_id: str, fmt: str) -> str:
+    return f"{_INGEST_PREFIX}{ingest_id}/input.{fmt}"
+
+
+def ingest_manifest_key(ingest_id: str) -> str:
+    return f"{_INGEST_PREFIX}{ingest_id}/manifest.jsonl"
+
+
+def is_ingest_key(key: str) -> bool:
+    """True for keys under ingest/ — the only objects an ingest may read."""
+    return key.startswith(_INGEST_PREFIX) and not key.endswith("/manifest.jsonl")
+
+
+# ── Drive archive queue ───────────────────────────────────────────────────────
+
+def drive_queue_key(drive_file_id: str) -> str:
+    return f"{_DRIVE_QUEUE_PREFIX}{drive_file_id}.json"
+
+
+def list_drive_queue(limit: int | None = None, marker: str = "") -> list[str]:
+    return list_keys(_DRIVE_QUEUE_PREFIX, limit, marker)
+
+
+def drive_dead_key(drive_file_id: str) -> str:
+    return f"{_DRIVE_DEAD_PREFIX}{drive_file_id}.json"
+
+
+# ── Request fingerprints (job dedup) ──────────────────────────────────────────
+
+def dedup_key(fingerprint: str) -> str:
+    return f"{_DEDUP_PREFIX}{fingerprint}.json"
 
 
 # ── Google Drive token persistence ────────────────────────────────────────────
@@ -161,15 +424,43 @@ def save_token(token_json: str) -> None:
     put_bytes(_TOKEN_KEY, token_json.encode(), "application/json")
 
 
+def acquire_token_lease(ttl: float) -> bool:
+    """
+    Take the cross-instance token-refresh lease for `ttl` seconds. False if
+    another instance holds it. A lease left behind by a crashed holder is
+    taken over once it has expired.
+    """
+    body = json.dumps({"expires": time.time() + ttl}).encode()
+    if put_bytes_if_absent(_TOKEN_LEASE_KEY, body, "application/json"):
+        return True
+    raw = get_bytes(_TOKEN_LEASE_KEY)
+    if raw is not None and json.loads(raw).get("expires", 0) > time.time():
+        return False
+    delete(_TOKEN_LEASE_KEY)
+    return put_bytes_if_absent(_TOKEN_LEASE_KEY, body, "application/json")
+
+
+def release_token_lease() -> None:
+    delete(_TOKEN_LEASE_KEY)
+
+
 # ── Images & PDFs ─────────────────────────────────────────────────────────────
 
-def put_image(phone: str, local_path: str | Path) -> str:
+def put_image(phone: str, data: bytes) -> str:
     key = f"{_IMAGE_PREFIX}{phone}.jpg"
-    put_file(key, local_path, "image/jpeg")
+    put_bytes(key, data, "image/jpeg")
     return key
 
 
-def put_pdf(file_id: str, local_path: str | Path) -> str:
+def derived_image_key(digest: str, rendition: str) -> str:
+    return f"{_DERIVED_IMAGE_PREFIX}{digest}-{rendition}.jpg"
+
+
+def pdf_cache_key(digest: str) -> str:
+    return f"{_PDF_PREFIX}{digest}.pdf"
+
+
+def put_pdf(file_id: str, data: bytes) -> str:
     key = f"{_PDF_PREFIX}{file_id}_resume.pdf"
-    put_file(key, local_path, "application/pdf")
+    put_bytes(key, data, "application/pdf")
     return key
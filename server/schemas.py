@@ -0,0 +1,16 @@
+"""
+Request models shared by the API routes and the bulk ingest worker, which
+validates every CSV/JSONL row against the same shape as /api/create-resume.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from pydantic import BaseModel, Field
+
+
+class CreateResumeRequest(BaseModel):
+    resume: dict[str, Any]
+    template: str = Field("A", pattern=r"^[A-M]$")
+    language: str = Field("English", max_length=20)
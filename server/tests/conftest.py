@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The server modules import each other as top-level modules (see PYTHONPATH
+# in docker-compose.yml).
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def already_exists():
+    """The error oss2 raises for a put with x-oss-forbid-overwrite on an existing key."""
+    from oss2.exceptions import make_exception
+
+    class _Response:
+        status = 409
+        headers = {"x-oss-request-id": "test"}
+
+        def read(self, amt=None):
+            return b"<Error><Code>FileAlreadyExists</Code><Message>The object already exists.</Message></Error>"
+
+    return make_exception(_Response())
+
+
+@pytest.fixture
+def existing_key_bucket(already_exists):
+    """A bucket on which every create-if-absent put finds the key taken."""
+    class _Bucket:
+        def put_object(self, key, data, headers=None):
+            raise already_exists
+
+    return _Bucket()
@@ -0,0 +1,76 @@
+import pytest
+
+import create_resume
+import llm_cache
+
+
+def _language_key(resume: dict) -> str:
+    variables = create_resume._language_variables(resume, "English")
+    messages = [(m.type, m.content) for m in create_resume._LANGUAGE_PROMPT.format_messages(**variables)]
+    return llm_cache.make_key("model", 0.0, messages)
+
+
+def test_language_pass_key_ignores_id_and_image_url():
+    resume = {"name": "Aisyah Rahman", "title": "Accountant", "about": "Detail-oriented accountant."}
+    first = _language_key({**resume, "id": "4821", "image": "https://x/images/a.jpg?Signature=abc"})
+    resubmit = _language_key({**resume, "id": "17", "image": "https://x/images/a.jpg?Signature=xyz"})
+    assert first == resubmit
+
+
+def test_passthrough_fields_are_restored_on_output():
+    resume = {"id": "17", "image": "https://x/a.jpg", "about": "old"}
+    enhanced = create_resume._restore_passthrough({"about": "new"}, resume)
+    assert enhanced == {"about": "new", "id": "17", "image": "https://x/a.jpg"}
+
+
+def test_get_llm_gives_each_event_loop_its_own_instance(monkeypatch):
+    import asyncio
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+    async def _llm():
+        return create_resume.get_llm()
+
+    first, second = asyncio.run(_llm()), asyncio.run(_llm())
+    assert first is not second
+    assert create_resume.get_llm() is create_resume.get_llm()
+
+
+def test_pdf_cache_hit_is_refreshed_near_lifecycle_expiry(monkeypatch):
+    import time
+
+    touched = []
+    monkeypatch.setattr(create_resume.oss_storage, "get_bytes", lambda key: pytest.fail("cache hit downloaded the PDF"))
+    monkeypatch.setattr(create_resume.oss_storage, "touch", lambda key, content_type=None: touched.append(key))
+
+    monkeypatch.setattr(create_resume.oss_storage, "object_last_modified", lambda key: time.time() - 60)
+    assert create_resume.cached_pdf_available("pdf/fresh.pdf")
+    monkeypatch.setattr(
+        create_resume.oss_storage, "object_last_modified", lambda key: time.time() - create_resume.PDF_CACHE_LIFETIME + 60
+    )
+    assert create_resume.cached_pdf_available("pdf/old.pdf")
+    monkeypatch.setattr(create_resume.oss_storage, "object_last_modified", lambda key: None)
+    assert not create_resume.cached_pdf_available("pdf/gone.pdf")
+    assert touched == ["pdf/old.pdf"]
+
+
+def test_single_shot_sync_and_async_send_the_same_prompt_and_merge_alike(monkeypatch):
+    import asyncio
+
+    resume = {"id": "17", "name": "Aisyah Rahman", "title": "Accountant", "number of jobs": 0}
+    sent = []
+
+    def invoke(prompt, llm, variables, json_mode=False):
+        sent.append((prompt, variables, json_mode))
+        return {"name": "Aisyah Rahman", "about": "new"}
+
+    async def ainvoke(prompt, llm, variables, json_mode=False):
+        return invoke(prompt, llm, variables, json_mode)
+
+    monkeypatch.setattr(create_resume, "invoke_cached", invoke)
+    monkeypatch.setattr(create_resume, "ainvoke_cached", ainvoke)
+
+    sync = create_resume.enhance_resume_single_shot(resume, None)
+    async_ = asyncio.run(create_resume.aenhance_resume_single_shot(resume, None))
+    assert sync == async_ == {"name": "Aisyah Rahman", "about": "new", "id": "17"}
+    assert sent[0] == sent[1]
@@ -0,0 +1,33 @@
+import json
+import time
+
+import drive_archive
+import oss_storage
+
+
+def test_drain_reaches_due_entries_behind_backed_off_ones(monkeypatch):
+    monkeypatch.setattr(drive_archive, "DRIVE_ARCHIVE_BATCH", 2)
+    later = time.time() + 3600
+    queue = {f"drive-queue/{i:03d}.json": {"drive_file_id": f"{i:03d}", "not_before": later} for i in range(20)}
+    queue["drive-queue/999.json"] = {"drive_file_id": "999", "not_before": 0}
+    drained = []
+
+    def list_drive_queue(limit=None, marker=""):
+        return [key for key in sorted(queue) if key > marker][:limit]
+
+    monkeypatch.setattr(drive_archive, "is_enabled", lambda: True)
+    monkeypatch.setattr(drive_archive.gdrive, "is_authorized", lambda: True)
+    monkeypatch.setattr(oss_storage, "list_drive_queue", list_drive_queue)
+    monkeypatch.setattr(oss_storage, "get_bytes", lambda key: json.dumps(queue[key]).encode())
+    monkeypatch.setattr(
+        drive_archive, "_drain_round",
+        lambda entries, pool, counts: drained.extend(entry["drive_file_id"] for entry in entries),
+    )
+
+    drive_archive.drain(budget=5)
+    assert drained == ["999"]
+
+
+def test_enqueue_of_a_queued_file_is_a_no_op(monkeypatch, existing_key_bucket):
+    monkeypatch.setattr(oss_storage, "_get_bucket", lambda: existing_key_bucket)
+    drive_archive.enqueue("drive-id", "resume.pdf", "application/pdf", "pdf/abc.pdf")
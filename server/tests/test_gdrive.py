@@ -0,0 +1,36 @@
+import json
+import time
+
+import pytest
+
+import gdrive
+import oss_storage
+
+
+def _token(expiry: str) -> bytes:
+    return json.dumps({
+        "token": f"access-{expiry}",
+        "refresh_token": "refresh",
+        "client_id": "client",
+        "client_secret": "secret",
+        "expiry": expiry,
+    }).encode()
+
+
+def test_held_lease_waits_for_the_token_another_instance_refreshes(monkeypatch, existing_key_bucket):
+    tokens = iter([_token("2020-01-01T00:00:00Z"), _token("2099-01-01T00:00:00Z")])
+    lease = json.dumps({"expires": time.time() + 30}).encode()
+
+    def get_bytes(key):
+        return lease if key == oss_storage._TOKEN_LEASE_KEY else next(tokens)
+
+    monkeypatch.setattr(oss_storage, "is_configured", lambda: True)
+    monkeypatch.setattr(oss_storage, "_get_bucket", lambda: existing_key_bucket)
+    monkeypatch.setattr(oss_storage, "get_bytes", get_bytes)
+    monkeypatch.setattr(gdrive.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(gdrive.Credentials, "refresh", lambda self, request: pytest.fail("refreshed under a held lease"))
+    monkeypatch.setattr(gdrive, "_creds", None)
+    monkeypatch.setattr(gdrive, "_unauthorized_until", 0.0)
+
+    creds = gdrive.get_credentials()
+    assert creds is not None and creds.token == "access-2099-01-01T00:00:00Z"
@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+import ingest
+import jobstore
+import oss_storage
+
+
+def test_non_object_jsonl_rows_are_failures_not_end_of_input():
+    rows = list(ingest.iter_rows(['{"resume": {}}\n', "null\n", "[1]\n", '{"resume": {}}\n'], "jsonl"))
+    assert [number for number, _ in rows] == [1, 2, 3, 4]
+    assert isinstance(rows[1][1], ValueError)
+    assert isinstance(rows[2][1], ValueError)
+    assert rows[3][1] == {"resume": {}}
+
+
+def test_ingest_keeps_going_past_a_null_row(tmp_path, monkeypatch):
+    monkeypatch.setattr(oss_storage, "is_configured", lambda: False)
+    monkeypatch.setattr(ingest, "_LOCAL_DIR", tmp_path)
+    monkeypatch.setattr(jobstore, "update_job", lambda job_id, **fields: None)
+
+    async def phase1(**kwargs):
+        return {}, "<html></html>", "file"
+
+    async def phase2(html, file_id, **kwargs):
+        return {"pdf_url": "u", "drive_url": None}
+
+    monkeypatch.setattr(ingest, "apipeline_phase1_llm", phase1)
+    monkeypatch.setattr(ingest, "apipeline_phase2_pdf", phase2)
+
+    source = tmp_path / "input.jsonl"
+    resume = json.dumps({"resume": {"name": "A"}})
+    source.write_text(f"{resume}\nnull\n{resume}\n")
+    asyncio.run(ingest.arun_ingest_job("ing", {"input": str(source), "format": "jsonl"}))
+
+    lines = [json.loads(line) for line in (tmp_path / "ing" / "manifest.jsonl").read_text().splitlines()]
+    assert sorted((line["row"], line["status"]) for line in lines) == [(1, "done"), (2, "failed"), (3, "done")]
+
+
+def test_only_ingest_inputs_are_accepted_as_oss_keys():
+    assert oss_storage.is_ingest_key("ingest/uploads/orders.csv")
+    assert not oss_storage.is_ingest_key("config/token.json")
+    assert not oss_storage.is_ingest_key("jobs/abc.jsonl")
+    assert not oss_storage.is_ingest_key("ingest/abc/manifest.jsonl")
+
+
+def test_upload_of_unknown_length_is_capped_while_streaming(tmp_path, monkeypatch):
+    import io
+
+    import pytest
+
+    monkeypatch.setattr(oss_storage, "is_configured", lambda: False)
+    monkeypatch.setattr(ingest, "_LOCAL_DIR", tmp_path)
+    monkeypatch.setattr(ingest, "INGEST_MAX_BYTES", 100)
+
+    assert ingest.store_input("small", "jsonl", io.BytesIO(b"x" * 100))
+    with pytest.raises(ingest.InputTooLarge):
+        ingest.store_input("big", "jsonl", io.BytesIO(b"x" * 101))
+    assert not (tmp_path / "big" / "input.jsonl").exists()
@@ -0,0 +1,56 @@
+import json
+import time
+
+import jobstore
+import oss_storage
+
+
+def _submission(resume_id: str, signature: str) -> dict:
+    return {
+        "template": "A",
+        "language": "English",
+        "resume": {
+            "id": resume_id,
+            "name": "Aisyah Rahman",
+            "title": "Accountant",
+            "image": (
+                "https://templite-prod.oss-ap-southeast-1.aliyuncs.com/images/60123456789.jpg"
+                f"?OSSAccessKeyId=STS.x&Expires=1760000000&Signature={signature}"
+            ),
+        },
+    }
+
+
+def test_fingerprint_ignores_resume_id_and_image_signature(monkeypatch):
+    monkeypatch.setattr(oss_storage, "OSS_BUCKET", "templite-prod")
+    monkeypatch.setattr(oss_storage, "OSS_ENDPOINT", "oss-ap-southeast-1-internal.aliyuncs.com")
+    monkeypatch.setattr(oss_storage, "OSS_PUBLIC_ENDPOINT", "oss-ap-southeast-1.aliyuncs.com")
+
+    first = jobstore.job_fingerprint(_submission("4821", "abc%3D"))
+    resubmit = jobstore.job_fingerprint(_submission("17", "xyz%3D"))
+    assert first == resubmit
+
+    changed = _submission("17", "xyz%3D")
+    changed["resume"]["title"] = "Auditor"
+    assert jobstore.job_fingerprint(changed) != first
+
+
+def test_local_update_does_not_revive_an_expired_job(monkeypatch):
+    store = jobstore.LocalJobStore(ttl=10, spill_path="")
+    now = 1000.0
+    monkeypatch.setattr(jobstore.time, "time", lambda: now)
+    store.set("job", {"status": "processing", "result": "stale"})
+
+    now += 11
+    store.update("job", {"status": "done"})
+    assert store.get("job") == {"created_at": now, "status": "done"}
+
+
+def test_claim_fingerprint_returns_the_existing_job(monkeypatch, existing_key_bucket):
+    monkeypatch.setattr(oss_storage, "is_configured", lambda: True)
+    monkeypatch.setattr(oss_storage, "_get_bucket", lambda: existing_key_bucket)
+    claim = json.dumps({"job_id": "first", "created_at": time.time()}).encode()
+    monkeypatch.setattr(oss_storage, "get_bytes", lambda key: claim)
+    monkeypatch.setattr(jobstore, "get_job", lambda job_id: {"status": "processing"})
+
+    assert jobstore.claim_fingerprint("abc", "second") == "first"
@@ -0,0 +1,56 @@
+import asyncio
+
+import jobstore
+import worker
+
+
+def test_batch_survives_an_item_whose_job_writes_fail(monkeypatch):
+    items = [
+        {"job_id": "broken", "payload": {"resume": {}}},
+        {"job_id": "ok", "payload": {"resume": {}}},
+    ]
+    writes = {}
+
+    def update_job(job_id, **fields):
+        if job_id == "broken":
+            raise OSError("OSS unavailable")
+        writes.setdefault(job_id, {}).update(fields)
+
+    async def phase1(**kwargs):
+        return {}, "<html></html>", "file"
+
+    async def finish(job_id, handoff, progress):
+        return "done"
+
+    monkeypatch.setattr(jobstore, "update_job", update_job)
+    monkeypatch.setattr(jobstore, "load_batch", lambda batch_id: items)
+    monkeypatch.setattr(jobstore, "get_jobs", lambda job_ids: {})
+    monkeypatch.setattr(worker, "apipeline_phase1_llm", phase1)
+    monkeypatch.setattr(worker, "_arender_and_finish", finish)
+
+    asyncio.run(worker.arun_batch_job("batch"))
+
+    assert writes["batch"]["status"] == "done"
+    assert writes["batch"]["completed"] == 1
+    assert writes["batch"]["failed"] == 1
+
+
+def test_worker_hands_off_to_the_pdf_function_without_worker_function(monkeypatch):
+    # The worker's own env: WORKER_FUNCTION is only set on the API function.
+    import fc_async
+
+    monkeypatch.setattr(fc_async, "FC_WORKER_FUNCTION", "")
+    monkeypatch.setattr(fc_async, "FC_PDF_WORKER_FUNCTION", "templite-pdf-worker")
+    monkeypatch.setattr(fc_async, "FC_ENDPOINT", "1234.ap-southeast-1.fc.aliyuncs.com")
+    submitted = []
+
+    async def phase1(**kwargs):
+        return {}, "<html></html>", "file"
+
+    monkeypatch.setattr(jobstore, "update_job", lambda job_id, **fields: None)
+    monkeypatch.setattr(jobstore, "save_handoff", lambda job_id, handoff: None)
+    monkeypatch.setattr(fc_async, "submit_pdf_stage", lambda job_id, payload: submitted.append(job_id))
+    monkeypatch.setattr(worker, "apipeline_phase1_llm", phase1)
+
+    assert asyncio.run(worker.arun_resume_job("job", {"resume": {}})) == "queued"
+    assert submitted == ["job"]
@@ -6,34 +6,275 @@ On Function Compute this runs as a *separate async invocation* (see fc_async.py)
 because an FC instance is frozen once its HTTP response returns — a background
 task started inside the request handler would not reliably finish.
 
-The same function is reused as the local-dev fallback (run in an asyncio task).
+The same entry point (arun_job) is reused as the local-dev fallback (run in an
+asyncio task). LLM calls and the Chromium render are awaited on the event loop
+instead of each holding a thread.
+
+Progress is recorded per stage (each enhanced section, HTML, PDF, upload) with
+timings — see JobProgress. A job is marked done once its PDF is in OSS; the
+Google Drive archive copy is queued for drive_archive after that
+(DRIVE_ARCHIVE=deferred, the default) or uploaded alongside the OSS upload
+(DRIVE_ARCHIVE=inline).
+
+A bulk order runs as one invocation (arun_batch_job): every resume is still an
+ordinary job, but they share this instance's warm Chromium, each rendering in
+its own context, so throughput scales with the instance instead of with cold
+starts. Each PDF is uploaded as soon as it is rendered.
+
+The LLM phase waits on the network while the PDF phase needs Chromium's memory
+and CPU. In two-stage mode (fc_async.split_stages(): PDF_WORKER_FUNCTION and
+WORKER_FC_ENDPOINT set on this function) they run as separate functions: this
+one enhances and renders HTML, stores the result with jobstore.save_handoff
+and queues arun_pdf_stage on the PDF function. The LLM function can then be a
+small instance with high instance concurrency, and the Chromium function only
+ever renders. Without it, both phases run here back to back. Within an
+instance, LLM_CONCURRENCY caps jobs in the LLM phase and PDF_CONCURRENCY
+(browser_pool) caps renders.
+
+Config (env):
+    LLM_CONCURRENCY     jobs in the LLM phase at once per instance (default 8)
+    BATCH_CONCURRENCY   resumes of one batch in flight at once (default 8);
+                        concurrent Chromium renders are still capped by
+                        PDF_CONCURRENCY in browser_pool
+    DRIVE_ARCHIVE       "deferred" (default) or "inline" — see create_resume
 """
 
 from __future__ import annotations
 
+import asyncio
+import os
+import time
 from typing import Any
 
+import fc_async
 import jobstore
-from create_resume import pipeline_phase1_llm, pipeline_phase2_pdf
+from create_resume import (
+    DRIVE_ARCHIVE,
+    apipeline_phase1_llm,
+    apipeline_phase2_pdf,
+    archive_pdf,
+    pipeline_rerender,
+)
+from ingest import arun_ingest_job
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Bound to the worker's event loop on first use.
+_llm_slots = asyncio.Semaphore(max(1, LLM_CONCURRENCY))
+
+
+class JobProgress:
+    """
+    Records pipeline stages and their timings on the job record.
+
+    Each mark appends {"stage", "elapsed"} (seconds since processing started)
+    and rewrites the job's `stage` / `stages` fields, so pollers and the SSE
+    endpoint see every transition plus per-stage latency. The worker is the
+    only writer while a job runs; marks are serialised so the list only grows.
+    A failed progress write is logged and never fails the job.
+    """
 
+    def __init__(self, job_id: str, started_at: float | None = None, stages: list[dict[str, Any]] | None = None):
+        # A job resumed by the PDF stage carries on from the LLM stage's clock.
+        self.job_id = job_id
+        self.started_at = started_at or time.time()
+        self.stages: list[dict[str, Any]] = list(stages or [])
+        self._alock = asyncio.Lock()
 
-def run_resume_job(job_id: str, payload: dict[str, Any]) -> None:
+    def _record(self, stage: str) -> dict[str, Any]:
+        self.stages.append({"stage": stage, "elapsed": round(time.time() - self.started_at, 3)})
+        return {"stage": stage, "stages": list(self.stages)}
+
+    async def amark(self, stage: str) -> None:
+        async with self._alock:
+            fields = self._record(stage)
+            try:
+                await asyncio.to_thread(jobstore.update_job, self.job_id, **fields)
+            except Exception as e:  # noqa: BLE001
+                print(f"[Job {self.job_id}] progress write failed: {e}")
+
+    def elapsed(self) -> float:
+        return round(time.time() - self.started_at, 3)
+
+
+def _load_enhanced_resume(source_job_id: str) -> dict:
+    """Fetch the enhanced resume a finished job stored in its result."""
+    source = jobstore.get_job(source_job_id)
+    enhanced = ((source or {}).get("result") or {}).get("enhanced_data")
+    if not enhanced:
+        raise RuntimeError(f"Job {source_job_id} has no enhanced resume to re-render.")
+    return enhanced
+
+
+async def arun_resume_job(job_id: str, payload: dict[str, Any], split_stages: bool | None = None) -> str:
     """
-    Execute a resume job end-to-end and record the outcome in the OSS job store.
+    Execute a resume job end-to-end and record the outcome in the job store.
 
     payload keys: resume (dict), template (str), language (str).
-    Each invocation is its own FC instance, so no in-process semaphore is needed —
-    concurrency is capped by FC's instance-concurrency + max-instances settings.
+    A re-render payload carries source_job_id instead of resume: the enhanced
+    resume stored by that job is reused and the LLM phase is skipped.
+    Job-store reads/writes are blocking OSS calls, so they run in threads.
+    Returns the final status, "done" or "failed", or "queued" when the PDF
+    stage was handed to the PDF function.
+
+    split_stages defaults to fc_async.split_stages(); batch runs pass False
+    to render on the instance that enhanced.
     """
-    jobstore.update_job(job_id, status="processing")
+    template = payload.get("template", "A")
+    language = payload.get("language", "English")
+    if split_stages is None:
+        split_stages = fc_async.split_stages()
+    progress = JobProgress(job_id)
     try:
-        enhanced_resume, html_content, file_id = pipeline_phase1_llm(
-            resume_data=payload["resume"],
-            template_key=payload.get("template", "A"),
-            language=payload.get("language", "English"),
+        await asyncio.to_thread(jobstore.update_job, job_id, status="processing", started_at=progress.started_at)
+        if payload.get("source_job_id"):
+            enhanced_resume = await asyncio.to_thread(_load_enhanced_resume, payload["source_job_id"])
+            html_content, file_id = await asyncio.to_thread(pipeline_rerender, enhanced_resume, template, language)
+            await progress.amark("render.html")
+        else:
+            async with _llm_slots:
+                enhanced_resume, html_content, file_id = await apipeline_phase1_llm(
+                    resume_data=payload["resume"],
+                    template_key=template,
+                    language=language,
+                    on_progress=progress.amark,
+                )
+        handoff = {
+            "enhanced_data": enhanced_resume,
+            "html": html_content,
+            "file_id": file_id,
+            "template": template,
+            "language": language,
+        }
+        if split_stages:
+            await progress.amark("queued.pdf")
+            handoff.update(started_at=progress.started_at, stages=list(progress.stages))
+            await asyncio.to_thread(jobstore.save_handoff, job_id, handoff)
+            await asyncio.to_thread(fc_async.submit_pdf_stage, job_id, {"stage": "pdf"})
+            return "queued"
+    except Exception as e:  # noqa: BLE001 — surface any failure to the poller
+        await asyncio.to_thread(
+            jobstore.update_job, job_id, status="failed", error=str(e), elapsed=progress.elapsed()
+        )
+        return "failed"
+    return await _arender_and_finish(job_id, handoff, progress)
+
+
+async def arun_pdf_stage(job_id: str) -> str:
+    """Second stage in two-stage mode: render and upload the HTML the LLM stage left."""
+    handoff = await asyncio.to_thread(jobstore.load_handoff, job_id)
+    if handoff is None:
+        await asyncio.to_thread(
+            jobstore.update_job, job_id, status="failed", error="Rendered HTML for this job is missing."
+        )
+        return "failed"
+    progress = JobProgress(job_id, handoff.get("started_at"), handoff.get("stages"))
+    return await _arender_and_finish(job_id, handoff, progress)
+
+
+async def _arender_and_finish(job_id: str, handoff: dict[str, Any], progress: JobProgress) -> str:
+    """
+    Phase 2 plus the final job write, shared by both modes. With deferred
+    Drive archiving the job is marked done as soon as the PDF is in OSS (its
+    drive_url already points at a reserved Drive id) and the Drive upload is
+    queued afterwards, so the poller never waits on it.
+    """
+    try:
+        result = await apipeline_phase2_pdf(
+            handoff["html"], handoff["file_id"], on_progress=progress.amark,
+            defer_drive=DRIVE_ARCHIVE == "deferred",
+        )
+        pending = result.pop("drive_pending", None)
+        result["enhanced_data"] = handoff["enhanced_data"]
+        result["template"] = handoff["template"]
+        result["language"] = handoff["language"]
+        await asyncio.to_thread(
+            jobstore.update_job, job_id, status="done", result=result, elapsed=progress.elapsed()
         )
-        result = pipeline_phase2_pdf(html_content, file_id)
-        result["enhanced_data"] = enhanced_resume
-        jobstore.update_job(job_id, status="done", result=result)
     except Exception as e:  # noqa: BLE001 — surface any failure to the poller
-        jobstore.update_job(job_id, status="failed", error=str(e))
+        await asyncio.to_thread(
+            jobstore.update_job, job_id, status="failed", error=str(e), elapsed=progress.elapsed()
+        )
+        return "failed"
+
+    if pending is not None:
+        try:
+            await asyncio.to_thread(archive_pdf, pending)
+        except Exception as e:  # noqa: BLE001 — the job itself succeeded
+            print(f"[GDrive] Could not queue archive of {pending.name}: {e}")
+    return "done"
+
+
+async def arun_batch_job(batch_id: str) -> None:
+    """
+    Run every resume of a bulk order, BATCH_CONCURRENCY at a time.
+
+    The batch record tracks `completed` / `failed` counts as items finish and
+    ends `done` once all have run (individual failures are on the item jobs).
+    Items already finished are skipped, so a retried invocation resumes
+    instead of starting over.
+    """
+    started_at = time.time()
+    await asyncio.to_thread(jobstore.update_job, batch_id, status="processing", started_at=started_at)
+    try:
+        items = await asyncio.to_thread(jobstore.load_batch, batch_id)
+        if items is None:
+            raise RuntimeError(f"Batch {batch_id} has no item list.")
+        existing = await asyncio.to_thread(jobstore.get_jobs, [item["job_id"] for item in items])
+    except Exception as e:  # noqa: BLE001
+        await asyncio.to_thread(jobstore.update_job, batch_id, status="failed", error=str(e))
+        return
+
+    counts = {"done": 0, "failed": 0}
+    pending = []
+    for item in items:
+        status = (existing.get(item["job_id"]) or {}).get("status")
+        if status in jobstore.TERMINAL_STATUSES:
+            counts[status] += 1
+        else:
+            pending.append(item)
+
+    slots = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+    write_lock = asyncio.Lock()
+
+    async def _run(item: dict[str, Any]) -> None:
+        try:
+            async with slots:
+                status = await arun_resume_job(item["job_id"], item["payload"], split_stages=False)
+        except Exception as e:  # noqa: BLE001 — e.g. the item's own failure write hit an OSS error
+            print(f"[Batch {batch_id}] item {item['job_id']} failed: {e}")
+            status = "failed"
+            try:
+                await asyncio.to_thread(jobstore.update_job, item["job_id"], status="failed", error=str(e))
+            except Exception as write_error:  # noqa: BLE001
+                print(f"[Batch {batch_id}] could not mark {item['job_id']} failed: {write_error}")
+        async with write_lock:
+            counts[status] += 1
+            try:
+                await asyncio.to_thread(
+                    jobstore.update_job, batch_id, completed=counts["done"], failed=counts["failed"]
+                )
+            except Exception as e:  # noqa: BLE001
+                print(f"[Batch {batch_id}] progress write failed: {e}")
+
+    print(f"[Batch {batch_id}] {len(pending)} of {len(items)} resumes to run")
+    # One item's failure must never abort the rest or leave the batch "processing".
+    await asyncio.gather(*(_run(item) for item in pending), return_exceptions=True)
+    await asyncio.to_thread(
+        jobstore.update_job, batch_id, status="done",
+        completed=counts["done"], failed=counts["failed"],
+        elapsed=round(time.time() - started_at, 3),
+    )
+
+
+async def arun_job(job_id: str, payload: dict[str, Any]) -> None:
+    """Worker entry point: a bulk-order batch, a CSV/JSONL ingest, a PDF stage, or a single resume job."""
+    if payload.get("stage") == "pdf":
+        await arun_pdf_stage(job_id)
+    elif payload.get("batch"):
+        await arun_batch_job(job_id)
+    elif payload.get("ingest"):
+        await arun_ingest_job(job_id, payload)
+    else:
+        await arun_resume_job(job_id, payload)